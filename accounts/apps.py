@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AcountsConfig(AppConfig):
@@ -7,3 +8,8 @@ class AcountsConfig(AppConfig):
 
     def ready(self):
         import accounts.signals
+
+        if settings.EXCHANGE_RATE_BACKGROUND_REFRESH:
+            from accounts.utils import start_rate_refresher
+
+            start_rate_refresher()
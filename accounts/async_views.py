@@ -0,0 +1,183 @@
+"""
+Async-native read views for deployments served over ASGI.
+
+DRF views are synchronous, so under ASGI each request holds a worker thread
+for its whole duration. These views authenticate, read the cache and query
+the database with the async APIs instead, returning the same payloads as
+their synchronous counterparts in accounts.views.
+"""
+
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from accounts.cache import (
+    acache_balance,
+    aget_cache_generation,
+    aget_cached_balance,
+)
+from accounts.models import Account, TransactionLog, Wallet
+from accounts.pagination import KeysetPagination
+from accounts.serializers import AccountDetailSerializer, TransactionLogSerializer
+from accounts.views import (
+    build_balance_payload,
+    history_tag,
+    payload_digest,
+)
+
+
+async def authenticate(request):
+    """
+    Async counterpart of JWTAuthentication.authenticate(): the token is
+    validated in process and the user is loaded with the async ORM.
+    """
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    token = authentication.get_validated_token(raw_token)
+    try:
+        user_id = token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise AuthenticationFailed(
+            "Token contained no recognizable user identification"
+        )
+    try:
+        user = await get_user_model().objects.aget(
+            **{api_settings.USER_ID_FIELD: user_id}
+        )
+    except get_user_model().DoesNotExist:
+        raise AuthenticationFailed("User not found")
+    if not user.is_active:
+        raise AuthenticationFailed("User is inactive")
+    return user
+
+
+def jwt_required(view):
+    """
+    Reject requests without a valid access token with 401, as the
+    IsAuthenticated permission does for the DRF views.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            user = await authenticate(request)
+        except AuthenticationFailed as e:
+            return unauthorized(e.detail)
+        if user is None:
+            return unauthorized("Authentication credentials were not provided.")
+        request.user = user
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def unauthorized(detail):
+    body = detail if isinstance(detail, dict) else {"detail": detail}
+    response = JsonResponse(body, status=401)
+    response["WWW-Authenticate"] = 'Bearer realm="api"'
+    return response
+
+
+def not_modified(request, etag):
+    """
+    Return a 304 response when If-None-Match carries `etag`, else None.
+    """
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag not in etags and "*" not in etags:
+        return None
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    return response
+
+
+def tagged_json_response(etag, data):
+    response = JsonResponse(data, encoder=DjangoJSONEncoder)
+    response["ETag"] = etag
+    return response
+
+
+@jwt_required
+async def account_balance(request, account_id):
+    """
+    Async view to retrieve the balance of a specific account.
+    """
+    generation = await aget_cache_generation(account_id)
+    payload = await aget_cached_balance(account_id, generation)
+    if payload is None:
+        try:
+            wallet = await Wallet.objects.select_related("account").aget(
+                account_id=account_id
+            )
+        except Wallet.DoesNotExist:
+            if not await Account.objects.filter(id=account_id).aexists():
+                error = f"Account with id {account_id} does not exist"
+            else:
+                error = f"Wallet for account with id {account_id} does not exist"
+            return JsonResponse({"error": error}, status=404)
+        payload = build_balance_payload(wallet)
+        await acache_balance(account_id, generation, payload)
+    etag = quote_etag(payload_digest(payload))
+    return not_modified(request, etag) or tagged_json_response(etag, payload)
+
+
+@jwt_required
+async def account_detail(request, pk):
+    """
+    Async view to retrieve account details.
+    """
+    try:
+        account = await Account.objects.select_related("wallet").aget(pk=pk)
+    except Account.DoesNotExist:
+        return JsonResponse({"message": "Account not found."}, status=404)
+    return JsonResponse(
+        AccountDetailSerializer(account).data, encoder=DjangoJSONEncoder
+    )
+
+
+@jwt_required
+async def account_transactions(request, account_id):
+    """
+    Async view to list transactions associated with a specific account, one
+    keyset page at a time.
+    """
+    version = (
+        await Wallet.objects.filter(account_id=account_id)
+        .values_list("ledger_version", flat=True)
+        .afirst()
+    )
+    if version is None:
+        if not await Account.objects.filter(id=account_id).aexists():
+            return JsonResponse(
+                {"message": "Transactions for this account not found."},
+                status=404,
+            )
+        version = 0
+    etag = quote_etag(history_tag(request, account_id, version))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    paginator = KeysetPagination()
+    try:
+        page = await paginator.apaginate_queryset(
+            TransactionLog.objects.filter(account_id=account_id), Request(request)
+        )
+    except NotFound as e:
+        return JsonResponse({"detail": e.detail}, status=404)
+    data = {
+        "next": paginator.get_next_link(),
+        "results": TransactionLogSerializer(page, many=True).data,
+    }
+    return tagged_json_response(etag, data)
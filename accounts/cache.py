@@ -0,0 +1,84 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def generation_cache_key(account_id):
+    return f"accounts:generation:{account_id}"
+
+
+def balance_cache_key(account_id, generation):
+    return f"accounts:balance:{account_id}:{generation}"
+
+
+def new_generation():
+    return uuid.uuid4().hex
+
+
+def get_cache_generation(account_id):
+    """
+    Return the current cache generation of `account_id`, starting one if
+    there is none. Readers must fetch it before loading from the database
+    and store what they load under it, so a load that races a write ends up
+    under a generation nobody reads any more.
+    """
+    key = generation_cache_key(account_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, new_generation(), None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_cache_generation(account_id):
+    key = generation_cache_key(account_id)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, new_generation(), None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def get_cached_balance(account_id, generation):
+    return cache.get(balance_cache_key(account_id, generation))
+
+
+def cache_balance(account_id, generation, payload):
+    cache.set(
+        balance_cache_key(account_id, generation),
+        payload,
+        settings.BALANCE_CACHE_TTL,
+    )
+
+
+async def aget_cached_balance(account_id, generation):
+    return await cache.aget(balance_cache_key(account_id, generation))
+
+
+async def acache_balance(account_id, generation, payload):
+    await cache.aset(
+        balance_cache_key(account_id, generation),
+        payload,
+        settings.BALANCE_CACHE_TTL,
+    )
+
+
+def invalidate_account_caches(account_ids):
+    """
+    Start a new cache generation for `account_ids` once the current database
+    transaction commits, orphaning their cached balance payloads. Entries a
+    reader stores under the old generation afterwards are never served.
+    Outside a transaction this happens immediately.
+    """
+    account_ids = list(account_ids)
+    transaction.on_commit(
+        lambda: cache.set_many(
+            {
+                generation_cache_key(account_id): new_generation()
+                for account_id in account_ids
+            },
+            None,
+        )
+    )
@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def stream_json_array(queryset, serializer_class, chunk_size):
+    """
+    Yield a JSON array of `queryset` serialized with `serializer_class`, one
+    chunk of rows at a time, so only `chunk_size` rows are held in memory.
+    """
+    yield "["
+    separator = ""
+    chunk = []
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(instance)
+        if len(chunk) >= chunk_size:
+            yield separator + _encode_chunk(chunk, serializer_class)
+            separator = ","
+            chunk = []
+    if chunk:
+        yield separator + _encode_chunk(chunk, serializer_class)
+    yield "]"
+
+
+def _encode_chunk(instances, serializer_class):
+    data = serializer_class(instances, many=True).data
+    return ",".join(json.dumps(item, cls=JSONEncoder) for item in data)
+
+
+def stream_csv(queryset, fields, chunk_size):
+    """
+    Yield `queryset` as CSV with a header row of `fields`. Rows are read as
+    plain tuples with values_list(), so no model instances are built, and are
+    encoded `chunk_size` rows at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(
+            [
+                value.isoformat() if hasattr(value, "isoformat") else value
+                for value in row
+            ]
+        )
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+_local = threading.local()
+
+
+def current_log_writer():
+    """
+    Return the TransactionLogWriter active in this thread, or None.
+    """
+    return getattr(_local, "writer", None)
+
+
+class TransactionLogWriter:
+    """
+    Write-behind mode for the transaction log.
+
+    While the writer is active in a thread, Transaction.save() queues its
+    TransactionLog row instead of inserting it. The queue is flushed with
+    one bulk_create once `batch_size` rows are pending or the oldest pending
+    row has waited `max_delay` seconds, and the batch's database transaction
+    is committed with it, so wallet updates and their log rows still commit
+    together. The window is checked as rows are added; leaving the block
+    drains what is left, or rolls the current batch back on error. The
+    transaction.saved events and metrics of a batch are emitted when it
+    commits and dropped with it on rollback. `before_commit`, if given, is
+    called inside each batch's transaction right before it commits, e.g. to
+    record how far the caller got.
+
+    Nothing flushes the window on its own: the batch's transaction belongs
+    to the caller's connection, so only the caller can commit it. A caller
+    that may go idle (waiting on input, say) must call commit_if_due()
+    while idle, or the open transaction keeps the rows invisible and the
+    wallets, on SQLite the whole database, locked. Wallet rows stay locked
+    until their batch commits, so keep windows short where other writers
+    touch the same wallets. load_transactions --write-behind uses this mode.
+
+        with TransactionLogWriter(batch_size=500) as writer:
+            for transaction in transactions:
+                transaction.save()
+            writer.commit_if_due()
+    """
+
+    def __init__(self, batch_size=None, max_delay=None, using=None, before_commit=None):
+        self.batch_size = batch_size or settings.TRANSACTION_LOG_BATCH_SIZE
+        if max_delay is None:
+            max_delay = settings.TRANSACTION_LOG_FLUSH_INTERVAL
+        self.max_delay = max_delay
+        self.using = using
+        self.before_commit = before_commit
+        self.flushed = 0
+        self._pending = []
+        self._oldest = None
+        self._atomic = None
+
+    def __enter__(self):
+        if current_log_writer() is not None:
+            raise RuntimeError("A TransactionLogWriter is already active.")
+        self._begin()
+        _local.writer = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.writer = None
+        atomic, self._atomic = self._atomic, None
+        if exc_type is None:
+            try:
+                self._flush()
+                if self.before_commit is not None:
+                    self.before_commit()
+            except Exception as e:
+                atomic.__exit__(type(e), e, e.__traceback__)
+                raise
+        else:
+            self._pending = []
+        return atomic.__exit__(exc_type, exc_value, traceback)
+
+    def add(self, log):
+        if not self._pending:
+            self._oldest = time.monotonic()
+        self._pending.append(log)
+
+    def commit_if_due(self):
+        """
+        Flush and commit the current batch if it is full or its window has
+        elapsed. Must be called outside any atomic block opened after the
+        writer, as Transaction.save() does once its own block has closed,
+        and periodically by callers that stop saving for a while.
+        """
+        if not self._pending:
+            return False
+        if (
+            len(self._pending) < self.batch_size
+            and time.monotonic() - self._oldest < self.max_delay
+        ):
+            return False
+        self._flush()
+        if self.before_commit is not None:
+            self.before_commit()
+        self._atomic.__exit__(None, None, None)
+        self._begin()
+        return True
+
+    def _begin(self):
+        self._atomic = transaction.atomic(using=self.using)
+        self._atomic.__enter__()
+
+    def _flush(self):
+        from accounts.models import DailyBalanceSnapshot, TransactionLog
+
+        if not self._pending:
+            return
+        logs = TransactionLog.objects.using(self.using).bulk_create(self._pending)
+        DailyBalanceSnapshot.record(logs)
+        self.flushed += len(logs)
+        self._pending = []
+        self._oldest = None
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import FirstValue, TruncDate
+
+from accounts.models import Account, DailyBalanceSnapshot, TransactionLog
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild daily balance snapshots from the transaction log. Accounts "
+        "are processed in chunks, each aggregated by the database and "
+        "upserted in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--accounts-per-chunk",
+            type=int,
+            default=500,
+            help="Accounts aggregated and committed together (default: 500).",
+        )
+        parser.add_argument(
+            "--account",
+            type=int,
+            action="append",
+            dest="accounts",
+            help="Only backfill this account id. May be given several times.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["accounts_per_chunk"]
+        if chunk_size < 1:
+            raise CommandError("--accounts-per-chunk must be positive.")
+
+        account_ids = Account.objects.order_by("id").values_list("id", flat=True)
+        if options["accounts"]:
+            account_ids = account_ids.filter(id__in=options["accounts"])
+        account_ids = list(account_ids)
+
+        total = 0
+        for start in range(0, len(account_ids), chunk_size):
+            chunk = account_ids[start : start + chunk_size]
+            total += backfill_accounts(chunk)
+            self.stdout.write(
+                f"{min(start + chunk_size, len(account_ids))}/{len(account_ids)} "
+                f"accounts, {total} snapshots"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} daily snapshots."))
+
+
+def backfill_accounts(account_ids):
+    """
+    Upsert the snapshot of every day with ledger activity for `account_ids`.
+    The last row per account and day by (transaction time, id) is picked
+    with a window function, so the rows are read in a single query.
+    """
+    last_rows = (
+        TransactionLog.objects.filter(account_id__in=account_ids)
+        .annotate(
+            day=TruncDate("transaction_time"),
+            last_id=Window(
+                FirstValue("id"),
+                partition_by=[F("account_id"), TruncDate("transaction_time")],
+                order_by=[F("transaction_time").desc(), F("id").desc()],
+            ),
+        )
+        .filter(id=F("last_id"))
+        .values_list("account_id", "day", "id", "current_balance")
+    )
+    with transaction.atomic():
+        snapshots = DailyBalanceSnapshot.upsert(
+            DailyBalanceSnapshot(
+                account_id=account_id,
+                day=day,
+                closing_balance=balance,
+                last_log_id=log_id,
+            )
+            for account_id, day, log_id, balance in last_rows
+        )
+    return len(snapshots)
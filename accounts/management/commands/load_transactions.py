@@ -0,0 +1,298 @@
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, transaction
+
+from accounts.ledger import TransactionLogWriter
+from accounts.models import Account, ImportCheckpoint, Transaction, Wallet
+from accounts.serializers import TransactionImportSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Import transactions from a CSV or JSONL file without going through "
+        "HTTP. Rows are applied in order per account with the same balance "
+        "rules as the API, in batches committed one at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file to import.")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl"],
+            help="File format. Defaults to the file extension.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows applied and committed together (default: 1000).",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help=(
+                "Checkpoint name under which the last committed row is stored "
+                "in the database, together with its batch. An interrupted "
+                "import run again with the same checkpoint resumes after that "
+                "row."
+            ),
+        )
+        parser.add_argument(
+            "--write-behind",
+            action="store_true",
+            help=(
+                "Apply rows one at a time with the same save path as the API, "
+                "batching their ledger rows with a TransactionLogWriter that "
+                "commits every --batch-size rows or "
+                "TRANSACTION_LOG_FLUSH_INTERVAL seconds."
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                "Worker processes. Each one imports the rows of a disjoint "
+                "shard of account ids (account id modulo the worker count)."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"File {path} does not exist.")
+        file_format = options["format"] or (
+            "csv" if path.lower().endswith(".csv") else "jsonl"
+        )
+        workers = options["workers"]
+        if workers < 1 or options["batch_size"] < 1:
+            raise CommandError("--workers and --batch-size must be positive.")
+        if options["write_behind"] and workers > 1 and connection.vendor == "sqlite":
+            # Each save() reads its wallet before writing, which on SQLite
+            # cannot wait for another worker's open write transaction.
+            raise CommandError("--write-behind cannot use several workers on SQLite.")
+
+        jobs = [
+            (
+                path,
+                file_format,
+                options["batch_size"],
+                options["checkpoint"],
+                shard,
+                workers,
+                options["write_behind"],
+            )
+            for shard in range(workers)
+        ]
+        started = time.monotonic()
+        if workers == 1:
+            totals = [load_shard(*jobs[0], stdout=self.stdout)]
+        else:
+            # Children must open their own database connections.
+            connections.close_all()
+            with multiprocessing.Pool(workers, initializer=django.setup) as pool:
+                totals = pool.starmap(load_shard, jobs)
+
+        elapsed = time.monotonic() - started
+        rows = sum(total["rows"] for total in totals)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {rows} rows in {elapsed:.1f}s "
+                f"({rows / elapsed if elapsed else rows:.0f} rows/s): "
+                f"{sum(t['success'] for t in totals)} succeeded, "
+                f"{sum(t['failed'] for t in totals)} failed, "
+                f"{sum(t['invalid'] for t in totals)} invalid."
+            )
+        )
+
+
+def read_rows(path, file_format):
+    """
+    Yield (row_number, row) for every data row of the file, numbered from 1.
+    Rows that are not valid JSON are yielded as the ValueError raised.
+    """
+    with open(path, newline="") as f:
+        if file_format == "csv":
+            for row_number, row in enumerate(csv.DictReader(f), start=1):
+                # Empty cells mean "use the default", as a missing JSON key does.
+                yield row_number, {k: v for k, v in row.items() if v != ""}
+            return
+        row_number = 0
+        for line in f:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                yield row_number, json.loads(line)
+            except ValueError as e:
+                yield row_number, e
+
+
+def row_account_id(row):
+    try:
+        return int(row["account"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def load_shard(
+    path,
+    file_format,
+    batch_size,
+    checkpoint,
+    shard,
+    shards,
+    write_behind=False,
+    stdout=None,
+):
+    """
+    Import the rows whose account id falls into `shard` of `shards`, batch by
+    batch, recording the last committed row under the shard's checkpoint
+    name in the same transaction as the batch.
+    """
+    stdout = stdout or sys.stdout
+    if checkpoint and shards > 1:
+        checkpoint = f"{checkpoint}.{shard}-of-{shards}"
+    resume_after = ImportCheckpoint.last_row(checkpoint) if checkpoint else 0
+    totals = {"rows": 0, "success": 0, "failed": 0, "invalid": 0}
+    started = time.monotonic()
+    rows = _shard_rows(path, file_format, resume_after, shard, shards)
+
+    if write_behind:
+        _save_rows(
+            rows,
+            totals,
+            checkpoint,
+            batch_size,
+            stdout,
+            report=lambda: _report(stdout, shard, shards, totals, started),
+        )
+        return totals
+
+    batch = []
+    last_row = resume_after
+    for row_number, row in rows:
+        batch.append((row_number, row))
+        last_row = row_number
+        if len(batch) >= batch_size:
+            _load_batch(batch, totals, checkpoint, last_row, stdout)
+            _report(stdout, shard, shards, totals, started)
+            batch = []
+    if batch:
+        _load_batch(batch, totals, checkpoint, last_row, stdout)
+        _report(stdout, shard, shards, totals, started)
+    return totals
+
+
+def _shard_rows(path, file_format, resume_after, shard, shards):
+    for row_number, row in read_rows(path, file_format):
+        if row_number <= resume_after:
+            continue
+        account_id = row_account_id(row) if isinstance(row, dict) else None
+        if shards > 1 and (account_id or 0) % shards != shard:
+            continue
+        yield row_number, row
+
+
+def _save_rows(rows, totals, checkpoint, batch_size, stdout, report):
+    """
+    Apply rows one at a time with Transaction.save() in write-behind mode.
+    The checkpoint is recorded inside each writer batch right before it
+    commits, so it always matches the rows that are durable.
+    """
+    progress = {"row": None}
+
+    def record_checkpoint():
+        if checkpoint and progress["row"] is not None:
+            ImportCheckpoint.record(checkpoint, progress["row"])
+
+    with TransactionLogWriter(
+        batch_size=batch_size, before_commit=record_checkpoint
+    ) as writer:
+        for row_number, row in rows:
+            # Set first: save() may commit the batch that includes this row.
+            progress["row"] = row_number
+            _save_row(row_number, row, totals, stdout)
+            # Rows that never reach save() still let a due batch commit.
+            writer.commit_if_due()
+            if totals["rows"] % batch_size == 0:
+                report()
+    report()
+
+
+def _save_row(row_number, row, totals, stdout):
+    totals["rows"] += 1
+    if isinstance(row, ValueError):
+        _report_invalid(stdout, totals, row_number, [f"Invalid JSON: {row}"])
+        return
+    serializer = TransactionImportSerializer(data=row)
+    if not serializer.is_valid():
+        _report_invalid(stdout, totals, row_number, serializer.errors)
+        return
+    pending = Transaction(**serializer.validated_data)
+    try:
+        pending.save()
+    except (Account.DoesNotExist, Wallet.DoesNotExist):
+        _report_invalid(
+            stdout,
+            totals,
+            row_number,
+            [f"Wallet for account with id {pending.account_id} does not exist"],
+        )
+    except ValidationError as e:
+        _report_invalid(stdout, totals, row_number, e.messages)
+    else:
+        totals[pending.transaction_status] += 1
+
+
+def _load_batch(batch, totals, checkpoint, last_row, stdout):
+    pending = []
+    pending_rows = []
+    for row_number, row in batch:
+        if isinstance(row, ValueError):
+            _report_invalid(stdout, totals, row_number, [f"Invalid JSON: {row}"])
+            continue
+        serializer = TransactionImportSerializer(data=row)
+        if serializer.is_valid():
+            pending.append(Transaction(**serializer.validated_data))
+            pending_rows.append(row_number)
+        else:
+            _report_invalid(stdout, totals, row_number, serializer.errors)
+    # bulk_apply locks the wallets as the first statement of this
+    # transaction, so the checkpoint commits with the batch without the
+    # transaction ever holding a read lock it has to upgrade on SQLite.
+    with transaction.atomic():
+        outcomes = Transaction.bulk_apply(pending)
+        if checkpoint:
+            ImportCheckpoint.record(checkpoint, last_row)
+    for row_number, outcome in zip(pending_rows, outcomes):
+        if isinstance(outcome, Transaction):
+            totals[outcome.transaction_status] += 1
+        else:
+            _report_invalid(stdout, totals, row_number, outcome.messages)
+    totals["rows"] += len(batch)
+
+
+def _report_invalid(stdout, totals, row_number, errors):
+    """
+    Count an invalid row and print its number and errors, so the rows can
+    be corrected and imported again.
+    """
+    totals["invalid"] += 1
+    stdout.write(f"Row {row_number} invalid: {json.dumps(errors)}\n")
+
+
+def _report(stdout, shard, shards, totals, started):
+    elapsed = time.monotonic() - started
+    rate = totals["rows"] / elapsed if elapsed else totals["rows"]
+    stdout.write(
+        f"[shard {shard + 1}/{shards}] {totals['rows']} rows, {rate:.0f} rows/s\n"
+    )
+    stdout.flush()
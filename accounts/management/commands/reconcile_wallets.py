@@ -0,0 +1,179 @@
+import multiprocessing
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import Case, F, Max, Min, Sum, When
+from django.db.models.functions import Coalesce
+
+from accounts.cache import invalidate_account_caches
+from accounts.constants import DEBIT, TRANSACTION_STATUS_SUCCESS
+from accounts.models import TransactionLog, Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every wallet balance against the sum of its successful ledger "
+        "entries. Accounts are split into id ranges that are aggregated by "
+        "the database, optionally across several worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Worker processes reconciling account id ranges in parallel.",
+        )
+        parser.add_argument(
+            "--accounts-per-chunk",
+            type=int,
+            default=5000,
+            help="Width of each account id range (default: 5000).",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.005,
+            help="Largest difference not reported as drift (default: 0.005).",
+        )
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Set drifted wallets to the balance recomputed from the ledger.",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        chunk_size = options["accounts_per_chunk"]
+        if workers < 1 or chunk_size < 1:
+            raise CommandError("--workers and --accounts-per-chunk must be positive.")
+
+        bounds = Wallet.objects.aggregate(low=Min("account_id"), high=Max("account_id"))
+        if bounds["low"] is None:
+            self.stdout.write("No wallets to reconcile.")
+            return
+        jobs = [
+            (
+                low,
+                min(low + chunk_size, bounds["high"] + 1),
+                options["tolerance"],
+                options["repair"],
+            )
+            for low in range(bounds["low"], bounds["high"] + 1, chunk_size)
+        ]
+
+        started = time.monotonic()
+        checked = 0
+        drifted = []
+        if workers == 1:
+            results = (reconcile_range(*job) for job in jobs)
+            checked, drifted = self.collect(results, len(jobs))
+        else:
+            # Children must open their own database connections.
+            connections.close_all()
+            with multiprocessing.Pool(workers, initializer=django.setup) as pool:
+                results = pool.imap_unordered(_reconcile_job, jobs)
+                checked, drifted = self.collect(results, len(jobs))
+
+        for account_id, balance, expected in sorted(drifted):
+            self.stdout.write(
+                f"Account {account_id}: wallet {balance:.2f}, ledger "
+                f"{expected:.2f}, delta {balance - expected:+.2f}"
+            )
+        elapsed = time.monotonic() - started
+        verb = "repaired" if options["repair"] else "drifted"
+        style = self.style.WARNING if drifted else self.style.SUCCESS
+        self.stdout.write(
+            style(
+                f"Reconciled {checked} wallets in {elapsed:.1f}s: "
+                f"{len(drifted)} {verb}."
+            )
+        )
+
+    def collect(self, results, total):
+        checked = 0
+        drifted = []
+        for done, (range_checked, range_drifted) in enumerate(results, start=1):
+            checked += range_checked
+            drifted += range_drifted
+            self.stdout.write(f"{done}/{total} account ranges")
+        return checked, drifted
+
+
+def _reconcile_job(job):
+    return reconcile_range(*job)
+
+
+def ledger_balances(account_ids=None, low=None, high=None):
+    """
+    Sum the successful ledger entries per account in the wallet currency,
+    credits positive and debits negative, without loading the rows.
+    """
+    amount = Coalesce("converted_amount", "transaction_amount")
+    logs = TransactionLog.objects.filter(transaction_status=TRANSACTION_STATUS_SUCCESS)
+    if account_ids is not None:
+        logs = logs.filter(account_id__in=account_ids)
+    else:
+        logs = logs.filter(account_id__gte=low, account_id__lt=high)
+    return dict(
+        logs.values("account_id")
+        .annotate(
+            total=Sum(Case(When(transaction_type=DEBIT, then=-amount), default=amount))
+        )
+        .values_list("account_id", "total")
+    )
+
+
+def reconcile_range(low, high, tolerance, repair):
+    """
+    Compare the wallets of accounts with ids in [low, high) to the ledger.
+    Returns the number of wallets checked and (account_id, balance,
+    expected) for each drifted one.
+
+    The wallets and the ledger are read in separate queries, so a
+    transaction applied in between can look like drift; candidates are
+    rechecked under lock before they are reported or repaired.
+    """
+    balances = dict(
+        Wallet.objects.filter(account_id__gte=low, account_id__lt=high).values_list(
+            "account_id", "balance"
+        )
+    )
+    expected = ledger_balances(low=low, high=high)
+    drifted = [
+        account_id
+        for account_id, balance in balances.items()
+        if abs(balance - expected.get(account_id, 0)) > tolerance
+    ]
+    if not drifted:
+        return len(balances), []
+    return len(balances), recheck_wallets(drifted, tolerance, repair)
+
+
+def recheck_wallets(account_ids, tolerance, repair):
+    """
+    Recompute the drifted wallets with their rows locked, so transactions
+    applied since the first pass are counted, and return those still
+    drifted. With `repair`, also write the ledger balance to them.
+    """
+    with transaction.atomic():
+        locked = Wallet.objects.filter(account_id__in=account_ids).order_by("pk")
+        if connection.features.has_select_for_update:
+            locked = locked.select_for_update()
+        else:
+            # SQLite has no row locks; take the database write lock instead.
+            locked.update(balance=F("balance"))
+        balances = dict(locked.values_list("account_id", "balance"))
+        expected = ledger_balances(account_ids=account_ids)
+        drifted = []
+        for account_id, balance in balances.items():
+            total = expected.get(account_id, 0)
+            if abs(balance - total) > tolerance:
+                drifted.append((account_id, balance, total))
+        if repair:
+            for account_id, _, total in drifted:
+                Wallet.objects.filter(account_id=account_id).update(balance=total)
+            invalidate_account_caches([account_id for account_id, _, _ in drifted])
+    return drifted
@@ -0,0 +1,197 @@
+"""
+In-process metrics exposed at /metrics in the Prometheus text format.
+
+Every thread records into its own shard, so the hot path takes no lock; the
+shards are only merged when the metrics are rendered. When a thread exits,
+its shard is folded into a retired aggregate, so short-lived threads do not
+leave a shard each behind. Values are per process: with several worker
+processes, scrape each one.
+"""
+
+import bisect
+import threading
+import weakref
+from math import inf
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+
+class _Shard:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def merge_into(self, counters, histograms):
+        # dict.copy() is atomic, so owners may keep writing meanwhile.
+        for key, value in self.counters.copy().items():
+            counters[key] = counters.get(key, 0) + value
+        for key, histogram in self.histograms.copy().items():
+            merged = histograms.setdefault(key, [0] * len(histogram))
+            for index, value in enumerate(list(histogram)):
+                merged[index] += value
+
+
+class _ShardOwner:
+    """
+    Thread-local handle on a shard. It is dropped with the thread's locals
+    when the thread exits, which retires the shard.
+    """
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms keyed by metric name and label values.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._descriptions = {}
+        self._shards = []
+        # Totals of the shards of threads that have exited
+        self._retired = _Shard()
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+
+    def describe(self, name, metric_type, help_text):
+        self._descriptions[name] = (metric_type, help_text)
+
+    def _shard(self):
+        owner = getattr(self._local, "owner", None)
+        if owner is None:
+            owner = self._local.owner = _ShardOwner(_Shard())
+            with self._shards_lock:
+                self._shards.append(owner.shard)
+            weakref.finalize(owner, self._retire, owner.shard)
+        return owner.shard
+
+    def _retire(self, shard):
+        # The owning thread is gone, so nothing writes to the shard any more.
+        with self._shards_lock:
+            self._shards.remove(shard)
+            shard.merge_into(self._retired.counters, self._retired.histograms)
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _label_key(labels))
+        counters = self._shard().counters
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, _label_key(labels))
+        histograms = self._shard().histograms
+        histogram = histograms.get(key)
+        if histogram is None:
+            # Bucket counts (the last one is +Inf), then sum
+            histogram = histograms[key] = [0] * (len(self.buckets) + 2)
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def collect(self):
+        """
+        Merge the shards into ({(name, labels): value}, {(name, labels):
+        [bucket counts..., sum]}).
+        """
+        counters = {}
+        histograms = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+            # Read under the lock, as retiring shards write to it.
+            self._retired.merge_into(counters, histograms)
+        for shard in shards:
+            shard.merge_into(counters, histograms)
+        return counters, histograms
+
+    def render(self):
+        """
+        Return all metrics in the Prometheus text exposition format.
+        """
+        counters, histograms = self.collect()
+        by_name = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for (name, labels), histogram in histograms.items():
+            by_name.setdefault(name, []).append((labels, histogram))
+
+        lines = []
+        for name in sorted(by_name):
+            metric_type, help_text = self._descriptions.get(name, (None, None))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            if metric_type:
+                lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                if isinstance(value, list):
+                    lines.extend(self._histogram_lines(name, labels, value))
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def _histogram_lines(self, name, labels, histogram):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (inf,), histogram):
+            cumulative += count
+            le = "+Inf" if bound == inf else _number(bound)
+            bucket_labels = _format_labels(labels + (("le", le),))
+            yield f"{name}_bucket{bucket_labels} {cumulative}"
+        yield f"{name}_sum{_format_labels(labels)} {_number(histogram[-1])}"
+        yield f"{name}_count{_format_labels(labels)} {cumulative}"
+
+    def clear(self):
+        with self._shards_lock:
+            for shard in self._shards + [self._retired]:
+                shard.counters.clear()
+                shard.histograms.clear()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = MetricsRegistry()
+
+metrics.describe(
+    "http_requests_total", COUNTER, "HTTP requests by route, method and status."
+)
+metrics.describe(
+    "http_request_duration_seconds", HISTOGRAM, "HTTP request latency by route."
+)
+metrics.describe(
+    "http_db_queries_total", COUNTER, "Database queries made by requests, by route."
+)
+metrics.describe(
+    "http_db_duration_seconds_total",
+    COUNTER,
+    "Time requests spent in database queries, by route.",
+)
+metrics.describe(
+    "fx_requests_total",
+    COUNTER,
+    "Exchange rate provider calls by provider and outcome.",
+)
+metrics.describe(
+    "fx_request_duration_seconds", HISTOGRAM, "Exchange rate provider call latency."
+)
+metrics.describe(
+    "transactions_total", COUNTER, "Applied transactions by type and status."
+)
@@ -0,0 +1,79 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+from accounts.metrics import metrics
+
+
+class MetricsMiddleware:
+    """
+    Record request counts and latency per route, and the number of database
+    queries and time spent in them for synchronous requests.
+
+    Async requests run their queries on other threads' connections, so only
+    counts and latency are recorded for them. Streaming responses are
+    measured up to the point their body starts streaming.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        route = self.record(request, response, started)
+        metrics.inc("http_db_queries_total", {"route": route}, queries.count)
+        metrics.inc("http_db_duration_seconds_total", {"route": route}, queries.seconds)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    def record(self, request, response, started):
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match else "unmatched"
+        metrics.observe(
+            "http_request_duration_seconds",
+            time.perf_counter() - started,
+            {"route": route},
+        )
+        metrics.inc(
+            "http_requests_total",
+            {
+                "route": route,
+                "method": request.method,
+                "status": response.status_code,
+            },
+        )
+        return route
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting queries and the time spent in them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
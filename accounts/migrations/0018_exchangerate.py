@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-17 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0017_remove_transaction_transaction_currency_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExchangeRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("base_currency", models.CharField(default="EUR", max_length=5)),
+                ("currency", models.CharField(max_length=5)),
+                ("rate", models.FloatField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("base_currency", "currency")},
+            },
+        ),
+    ]
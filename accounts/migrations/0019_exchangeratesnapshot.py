@@ -0,0 +1,62 @@
+# Generated by Django 5.0.6 on 2026-10-17 20:55
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0018_exchangerate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExchangeRateSnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("base_currency", models.CharField(default="EUR", max_length=5)),
+                ("source", models.CharField(blank=True, max_length=20)),
+                ("rates", models.JSONField()),
+                ("fetched_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "get_latest_by": "fetched_at",
+                "indexes": [
+                    models.Index(
+                        fields=["base_currency", "fetched_at"],
+                        name="accounts_fx_snapshot_time_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="rate_snapshot",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="accounts.exchangeratesnapshot",
+            ),
+        ),
+        migrations.AddField(
+            model_name="transactionlog",
+            name="rate_snapshot",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="accounts.exchangeratesnapshot",
+            ),
+        ),
+    ]
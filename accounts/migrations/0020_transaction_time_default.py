@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-17 20:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0019_exchangeratesnapshot"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transaction",
+            name="transaction_time",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name="transactionlog",
+            name="transaction_time",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
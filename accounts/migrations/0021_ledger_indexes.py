@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-17 21:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0020_transaction_time_default"),
+    ]
+
+    # Create the composite indexes before dropping the single-column account
+    # indexes they replace, so account lookups are never left unindexed.
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["account", "transaction_time", "id"],
+                name="accounts_tx_acct_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transactionlog",
+            index=models.Index(
+                fields=["account", "transaction_time", "id"],
+                name="accounts_txlog_acct_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transactionlog",
+            index=models.Index(
+                fields=["transaction_time", "id"], name="accounts_txlog_time_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="account",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="accounts.account",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transactionlog",
+            name="account",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="accounts.account",
+            ),
+        ),
+    ]
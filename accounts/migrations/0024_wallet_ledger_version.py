@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 21:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0023_import_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wallet",
+            name="ledger_version",
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
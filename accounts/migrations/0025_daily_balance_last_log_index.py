@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0024_wallet_ledger_version"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="dailybalancesnapshot",
+            name="last_log",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="accounts.transactionlog",
+            ),
+        ),
+    ]
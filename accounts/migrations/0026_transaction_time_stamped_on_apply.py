@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 21:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0025_daily_balance_last_log_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transaction",
+            name="transaction_time",
+            field=models.DateTimeField(),
+        ),
+    ]
@@ -1,6 +1,18 @@
-from django.db import models
+import logging
+import time
+from collections import Counter
+from datetime import datetime, time as day_time
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import F
 from django.core.exceptions import ValidationError
-from accounts.utils import convert_currency
+from django.utils import timezone
+from accounts.cache import invalidate_account_caches
+from accounts.ledger import current_log_writer
+from accounts.metrics import metrics
+from accounts.timing import phase, record_phase
+from accounts.utils import convert_currency, cross_rate, get_rate_table
 from accounts.constants import (
     DEBIT,
     CREDIT,
@@ -10,6 +22,73 @@ from accounts.constants import (
     TRANSACTION_STATUS_CHOICES,
 )
 
+logger = logging.getLogger("transactions")
+
+
+class ExchangeRate(models.Model):
+    """
+    Exchange rate maintained locally and served by DatabaseRateProvider.
+    """
+
+    base_currency = models.CharField(max_length=5, default="EUR")
+    currency = models.CharField(max_length=5)
+    rate = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("base_currency", "currency")
+
+    def __str__(self):
+        return f"1 {self.base_currency} = {self.rate} {self.currency}"
+
+
+class ExchangeRateSnapshot(models.Model):
+    """
+    A full rate table as fetched from a provider at `fetched_at`.
+
+    Transactions reference the snapshot they were converted with, and
+    `as_of()` finds the table that was current at any point in time.
+    """
+
+    base_currency = models.CharField(max_length=5, default="EUR")
+    source = models.CharField(max_length=20, blank=True)
+    rates = models.JSONField()
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["base_currency", "fetched_at"],
+                name="accounts_fx_snapshot_time_idx",
+            ),
+        ]
+        get_latest_by = "fetched_at"
+
+    def __str__(self):
+        return f"{self.base_currency} rates from {self.source} at {self.fetched_at}"
+
+    @classmethod
+    def as_of(cls, when, base_currency=None):
+        """
+        Return the snapshot that was current at `when`, or None.
+        """
+        base_currency = base_currency or settings.EXCHANGE_RATE_BASE_CURRENCY
+        return (
+            cls.objects.filter(base_currency=base_currency, fetched_at__lte=when)
+            .order_by("-fetched_at")
+            .first()
+        )
+
+    def convert(self, amount, from_currency, to_currency):
+        if from_currency == to_currency:
+            return amount
+        rate = cross_rate(self.rates, from_currency, to_currency)
+        if rate is None:
+            raise ValueError(
+                f"Snapshot {self.pk} has no rate from {from_currency} to {to_currency}"
+            )
+        return amount * rate
+
 
 class Account(models.Model):
     first_name = models.CharField(max_length=100)
@@ -23,7 +102,8 @@ class Account(models.Model):
 
     def update_wallet_currency(self, new_currency):
         """
-        Update the currency of the associated wallet.
+        Update the currency of the associated wallet. Saving the wallet
+        invalidates the cached balance through the post_save signal.
         """
         if hasattr(self, "wallet"):
             self.wallet.currency = new_currency
@@ -36,14 +116,20 @@ class Wallet(models.Model):
     account = models.OneToOneField(Account, on_delete=models.CASCADE)
     balance = models.FloatField(default=0.00)
     currency = models.CharField(max_length=5, default="EUR")
+    # Number of ledger rows written for the account, bumped in the same
+    # UPDATE that applies them; history ETags are derived from it.
+    ledger_version = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return f"Wallet of account {self.account}: {self.currency} {self.balance}"
 
 
 class Transaction(models.Model):
-    account = models.ForeignKey(Account, on_delete=models.CASCADE)
-    transaction_time = models.DateTimeField(auto_now_add=True)
+    # Indexed as the leading column of the composite index below.
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, db_index=False)
+    # Stamped once the wallet row is locked, so times follow the order in
+    # which transactions are applied; imports may supply their own.
+    transaction_time = models.DateTimeField()
     transaction_amount = models.FloatField(default=0.00)
     transaction_amount_currency = models.CharField(max_length=5, default="EUR")
     transaction_type = models.CharField(
@@ -55,52 +141,155 @@ class Transaction(models.Model):
         default=TRANSACTION_STATUS_SUCCESS,
     )
     current_balance = models.FloatField(default=0.00)
+    rate_snapshot = models.ForeignKey(
+        ExchangeRateSnapshot, null=True, blank=True, on_delete=models.SET_NULL
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["account", "transaction_time", "id"],
+                name="accounts_tx_acct_time_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Transaction of {self.transaction_amount} {self.transaction_amount_currency} for {self.account.email} at {self.transaction_time}"
 
     def save(self, *args, **kwargs):
+        started = time.perf_counter()
         # Retrieve the wallet associated with the account
-        wallet = Wallet.objects.get(account=self.account)
+        with phase("wallet"):
+            wallet = Wallet.objects.get(account=self.account)
 
         # Convert transaction amount to wallet's currency
         try:
-            converted_amount = convert_currency(
-                self.transaction_amount,
-                self.transaction_amount_currency,
-                wallet.currency,
-            )
+            with phase("fx"):
+                rates = None
+                if self.transaction_amount_currency != wallet.currency:
+                    rates = get_rate_table()
+                self.rate_snapshot_id = getattr(rates, "snapshot_id", None)
+                converted_amount = convert_currency(
+                    self.transaction_amount,
+                    self.transaction_amount_currency,
+                    wallet.currency,
+                    rates=rates,
+                )
         except ValueError as e:
+            logger.warning(
+                "Transaction rejected: %s",
+                e,
+                extra={"event": self.log_event("transaction.rejected", started)},
+            )
+            metrics.inc(
+                "transactions_total",
+                {"type": self.transaction_type, "status": "rejected"},
+            )
             raise ValidationError(str(e))
 
-        # Calculate new balance after the transaction
-        if self.transaction_type == DEBIT:
-            if wallet.balance < converted_amount:
-                self.transaction_status = TRANSACTION_STATUS_FAILED
-                # If the balance is insufficient, do not modify the balance
-                new_balance = wallet.balance
-            else:
-                new_balance = wallet.balance - converted_amount
-        else:  # CREDIT
-            new_balance = wallet.balance + converted_amount
+        writer = current_log_writer()
+        with transaction.atomic():
+            with phase("wallet"):
+                self.apply_to_wallet(wallet, converted_amount)
+            if self.transaction_time is None:
+                self.transaction_time = timezone.now()
 
-        # Update wallet balance if the transaction is successful
-        if self.transaction_status != TRANSACTION_STATUS_FAILED:
-            wallet.balance = new_balance
-            wallet.save()
+            with phase("log"):
+                # Log the transaction
+                log = self.log_transaction(wallet, wallet.balance, converted_amount)
+                if writer is None:
+                    DailyBalanceSnapshot.record([log])
+
+                # Call the superclass's save() method
+                super().save(*args, **kwargs)
+
+            invalidate_account_caches([self.account_id])
+            committing = time.perf_counter()
+        record_phase("commit", time.perf_counter() - committing)
+
+        event = self.log_event("transaction.saved", started)
+        event.update(
+            wallet_currency=wallet.currency,
+            converted_amount=converted_amount,
+            current_balance=self.current_balance,
+        )
+        labels = {"type": self.transaction_type, "status": self.transaction_status}
+
+        def report():
+            logger.info("Transaction saved", extra={"event": event})
+            metrics.inc("transactions_total", labels)
+
+        # Report only once the rows are durable; with a TransactionLogWriter
+        # active that is when the batch holding this row commits, so register
+        # before the writer gets a chance to close it.
+        transaction.on_commit(report)
+
+        if writer is not None:
+            # Queue the log row only once the transaction row is saved
+            writer.add(log)
+            writer.commit_if_due()
 
-        # Set current balance after the transaction
-        self.current_balance = new_balance
+    def apply_to_wallet(self, wallet, converted_amount):
+        # Apply the balance change as one conditional UPDATE so concurrent
+        # writers on the same wallet can neither lose updates nor overdraw it
+        wallets = Wallet.objects.filter(pk=wallet.pk)
+        next_version = F("ledger_version") + 1
+        if self.transaction_status != TRANSACTION_STATUS_FAILED:
+            if self.transaction_type == DEBIT:
+                updated = wallets.filter(balance__gte=converted_amount).update(
+                    balance=F("balance") - converted_amount,
+                    ledger_version=next_version,
+                )
+            else:  # CREDIT
+                updated = wallets.update(
+                    balance=F("balance") + converted_amount,
+                    ledger_version=next_version,
+                )
+            if not updated:
+                # If the balance is insufficient, do not modify the balance
+                self.transaction_status = TRANSACTION_STATUS_FAILED
+        if self.transaction_status == TRANSACTION_STATUS_FAILED:
+            # A failed transaction is still logged
+            wallets.update(ledger_version=next_version)
 
-        # Log the transaction
-        self.log_transaction(wallet, wallet.balance, converted_amount)
+        # Set current balance after the transaction; the updated row stays
+        # locked until commit, so this reads our own write
+        wallet.balance = Wallet.objects.values_list("balance", flat=True).get(
+            pk=wallet.pk
+        )
+        self.current_balance = wallet.balance
 
-        # Call the superclass's save() method
-        super().save(*args, **kwargs)
+    def log_event(self, name, started):
+        """
+        Structured fields describing this transaction for the transactions
+        logger, with the time spent since `started`.
+        """
+        return {
+            "event": name,
+            "transaction_id": self.pk,
+            "account_id": self.account_id,
+            "transaction_type": self.transaction_type,
+            "transaction_status": self.transaction_status,
+            "amount": self.transaction_amount,
+            "currency": self.transaction_amount_currency,
+            "rate_snapshot_id": self.rate_snapshot_id,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
 
     def log_transaction(self, wallet, balance_before, converted_amount):
-        TransactionLog.objects.create(
-            account=self.account,
+        """
+        Build the log row and insert it, unless a TransactionLogWriter is
+        active to batch it with others.
+        """
+        log = self.build_log(wallet, converted_amount)
+        if current_log_writer() is None:
+            log.save()
+        return log
+
+    def build_log(self, wallet, converted_amount):
+        return TransactionLog(
+            account_id=self.account_id,
+            transaction_time=self.transaction_time,
             transaction_type=self.transaction_type,
             transaction_status=self.transaction_status,
             transaction_amount=self.transaction_amount,
@@ -108,13 +297,151 @@ class Transaction(models.Model):
             converted_amount=converted_amount,
             wallet_currency=wallet.currency,
             current_balance=self.current_balance,
+            rate_snapshot_id=self.rate_snapshot_id,
+        )
+
+    @classmethod
+    def bulk_apply(cls, transactions):
+        """
+        Apply unsaved transactions in the given order with batched writes.
+
+        The wallets involved are locked first, so the whole batch runs under
+        the lock even inside an enclosing transaction. Currencies are then
+        converted once per currency pair from a single rate table, every
+        transaction is applied to its wallet in order with the same rules as
+        save(), and each wallet gets one UPDATE of its balance and ledger
+        version while Transaction and TransactionLog rows are inserted with
+        bulk_create, all in one DB transaction.
+
+        Returns a list aligned with `transactions` holding the saved
+        Transaction, or the ValidationError that kept it from being applied.
+        """
+        started = time.perf_counter()
+        results = [None] * len(transactions)
+
+        with transaction.atomic():
+            # Lock in primary key order so concurrent batches with overlapping
+            # wallets queue up instead of deadlocking.
+            locked = Wallet.objects.filter(
+                account_id__in={t.account_id for t in transactions}
+            ).order_by("pk")
+            if connection.features.has_select_for_update:
+                locked = locked.select_for_update()
+            else:
+                # SQLite has no row locks; a no-op write as the transaction's
+                # first statement takes the database write lock up front
+                # instead of failing to upgrade a read lock later.
+                locked.update(balance=F("balance"))
+            wallets = {wallet.account_id: wallet for wallet in locked}
+            balances = {wallet.pk: wallet.balance for wallet in wallets.values()}
+
+            rates = None
+            if any(
+                t.account_id in wallets
+                and t.transaction_amount_currency != wallets[t.account_id].currency
+                for t in transactions
+            ):
+                rates = get_rate_table()
+            snapshot_id = getattr(rates, "snapshot_id", None)
+
+            pair_rates = {}
+            converted = {}
+            for index, t in enumerate(transactions):
+                wallet = wallets.get(t.account_id)
+                if wallet is None:
+                    results[index] = ValidationError(
+                        f"Wallet for account with id {t.account_id} does not exist"
+                    )
+                    continue
+                pair = (t.transaction_amount_currency, wallet.currency)
+                if pair not in pair_rates:
+                    try:
+                        pair_rates[pair] = convert_currency(1, *pair, rates=rates)
+                    except ValueError as e:
+                        pair_rates[pair] = ValidationError(str(e))
+                if isinstance(pair_rates[pair], ValidationError):
+                    results[index] = pair_rates[pair]
+                    continue
+                converted[index] = t.transaction_amount * pair_rates[pair]
+                t.rate_snapshot_id = snapshot_id if pair[0] != pair[1] else None
+
+            applied_at = timezone.now()
+            deltas = {}
+            logged = Counter()
+            applied = []
+            for index, amount in converted.items():
+                t = transactions[index]
+                if t.transaction_time is None:
+                    t.transaction_time = applied_at
+                wallet = wallets[t.account_id]
+                delta = 0
+                if t.transaction_status != TRANSACTION_STATUS_FAILED:
+                    if t.transaction_type == DEBIT:
+                        if balances[wallet.pk] < amount:
+                            t.transaction_status = TRANSACTION_STATUS_FAILED
+                        else:
+                            delta = -amount
+                    else:  # CREDIT
+                        delta = amount
+                balances[wallet.pk] += delta
+                deltas[wallet.pk] = deltas.get(wallet.pk, 0) + delta
+                logged[wallet.pk] += 1
+                t.current_balance = balances[wallet.pk]
+                applied.append((index, t, wallet, amount))
+
+            for wallet_pk, delta in deltas.items():
+                Wallet.objects.filter(pk=wallet_pk).update(
+                    balance=F("balance") + delta,
+                    ledger_version=F("ledger_version") + logged[wallet_pk],
+                )
+            cls.objects.bulk_create([t for _, t, _, _ in applied])
+            logs = TransactionLog.objects.bulk_create(
+                [t.build_log(wallet, amount) for _, t, wallet, amount in applied]
+            )
+            DailyBalanceSnapshot.record(logs)
+            invalidate_account_caches({t.account_id for _, t, _, _ in applied})
+
+        for index, t, _, _ in applied:
+            results[index] = t
+        counts = Counter(
+            (t.transaction_type, t.transaction_status) for _, t, _, _ in applied
+        )
+        failed = sum(
+            count
+            for (_, status), count in counts.items()
+            if status == TRANSACTION_STATUS_FAILED
         )
+        event = {
+            "event": "transaction.bulk_applied",
+            "count": len(transactions),
+            "success": len(applied) - failed,
+            "failed": failed,
+            "invalid": len(transactions) - len(applied),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+        def report():
+            for (transaction_type, status), count in counts.items():
+                metrics.inc(
+                    "transactions_total",
+                    {"type": transaction_type, "status": status},
+                    count,
+                )
+            logger.info(
+                "Applied %d transactions in bulk",
+                len(transactions),
+                extra={"event": event},
+            )
+
+        transaction.on_commit(report)
+        return results
 
 
 class TransactionLog(models.Model):
-    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    # Indexed as the leading column of the composite index below.
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, db_index=False)
     wallet_currency = models.CharField(max_length=5, default="EUR")
-    transaction_time = models.DateTimeField(auto_now=True)
+    transaction_time = models.DateTimeField(default=timezone.now)
     transaction_type = models.CharField(max_length=10, choices=TRANSACTION_TYPE_CHOICES)
     transaction_currency = models.CharField(max_length=5, default="EUR")
     transaction_amount = models.FloatField()
@@ -125,6 +452,36 @@ class TransactionLog(models.Model):
         default=TRANSACTION_STATUS_SUCCESS,
     )
     current_balance = models.FloatField()
+    rate_snapshot = models.ForeignKey(
+        ExchangeRateSnapshot, null=True, blank=True, on_delete=models.SET_NULL
+    )
+
+    class Meta:
+        indexes = [
+            # Account history pages and per-account time ranges
+            models.Index(
+                fields=["account", "transaction_time", "id"],
+                name="accounts_txlog_acct_time_idx",
+            ),
+            # Full ledger pages
+            models.Index(
+                fields=["transaction_time", "id"],
+                name="accounts_txlog_time_idx",
+            ),
+        ]
+
+    @classmethod
+    def as_of(cls, account_id, when):
+        """
+        Return the last ledger row of the account at or before `when`, or
+        None. Seeks backwards along the (account, time, id) index.
+        """
+        return (
+            cls.objects.filter(account_id=account_id, transaction_time__lte=when)
+            .order_by("-transaction_time", "-id")
+            .first()
+        )
+
 
 def save(self, *args, **kwargs):
     # Format transaction_amount, converted_amount, and current_balance to have 2 digits after the decimal point
@@ -139,3 +496,151 @@ def save(self, *args, **kwargs):
 
     def __str__(self):
         return f"TransactionLog for {self.account.email} at {self.transaction_time}"
+
+
+class DailyBalanceSnapshot(models.Model):
+    """
+    Closing balance of an account's wallet on a day, taken from the ledger
+    row that is last on that day by (transaction time, id).
+
+    Rows are upserted in the same database transaction as the ledger rows
+    they summarize; the backfill_balance_snapshots command rebuilds them
+    from history. balance_as_of() reads them so historical balances only
+    look at the ledger rows of a single day.
+    """
+
+    # Indexed as the leading column of the unique constraint below.
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, db_index=False)
+    day = models.DateField()
+    closing_balance = models.FloatField()
+    # Indexed so deleting ledger rows does not scan the snapshots.
+    last_log = models.ForeignKey(
+        TransactionLog, on_delete=models.CASCADE, related_name="+"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account", "day"], name="accounts_daily_balance_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Balance of account {self.account_id} on {self.day}: {self.closing_balance}"
+
+    @classmethod
+    def record(cls, logs):
+        """
+        Update the snapshots of the days touched by freshly inserted ledger
+        rows. Must run in the transaction that applied them, while the
+        wallets are locked, so concurrent writers cannot interleave.
+        """
+        latest = {}
+        for log in logs:
+            if log.pk is None:
+                # Backends that cannot return ids from bulk inserts; those
+                # days are picked up by the backfill command.
+                continue
+            key = (log.account_id, timezone.localdate(log.transaction_time))
+            if key not in latest or ledger_order(log) > ledger_order(latest[key]):
+                latest[key] = log
+        if not latest:
+            return []
+        # Imports may apply rows out of time order; never replace a day's
+        # snapshot with a row that comes before its current one.
+        existing = cls.objects.filter(
+            account_id__in={account_id for account_id, _ in latest},
+            day__in={day for _, day in latest},
+        ).values_list("account_id", "day", "last_log__transaction_time", "last_log")
+        for account_id, day, logged_at, log_id in existing:
+            log = latest.get((account_id, day))
+            if log is not None and (logged_at, log_id) > ledger_order(log):
+                del latest[(account_id, day)]
+        return cls.upsert(
+            cls(
+                account_id=account_id,
+                day=day,
+                closing_balance=log.current_balance,
+                last_log_id=log.pk,
+            )
+            for (account_id, day), log in latest.items()
+        )
+
+    @classmethod
+    def upsert(cls, snapshots):
+        snapshots = list(snapshots)
+        if not snapshots:
+            return snapshots
+        return cls.objects.bulk_create(
+            snapshots,
+            update_conflicts=True,
+            unique_fields=["account", "day"],
+            update_fields=["closing_balance", "last_log", "updated_at"],
+        )
+
+    @classmethod
+    def balance_as_of(cls, account_id, when):
+        """
+        Return the ledger row that sets the account's balance at `when`, or
+        None: the last row of `when`'s day up to `when`, else the row behind
+        the nearest earlier snapshot. Without an earlier snapshot (history not
+        backfilled yet) it falls back to a seek over the whole ledger.
+        """
+        day = timezone.localdate(when)
+        day_start = timezone.make_aware(datetime.combine(day, day_time.min))
+        log = (
+            TransactionLog.objects.filter(
+                account_id=account_id,
+                transaction_time__gte=day_start,
+                transaction_time__lte=when,
+            )
+            .order_by("-transaction_time", "-id")
+            .first()
+        )
+        if log is not None:
+            return log
+        snapshot = (
+            cls.objects.filter(account_id=account_id, day__lt=day)
+            .select_related("last_log")
+            .order_by("-day")
+            .first()
+        )
+        if snapshot is not None:
+            return snapshot.last_log
+        return TransactionLog.as_of(account_id, when)
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Last row of a load_transactions import that has been committed, written
+    in the same database transaction as the batch it covers so a resumed
+    import never applies a batch twice.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    row = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Import {self.name} committed through row {self.row}"
+
+    @classmethod
+    def last_row(cls, name):
+        return (
+            cls.objects.filter(name=name).values_list("row", flat=True).first() or 0
+        )
+
+    @classmethod
+    def record(cls, name, row):
+        # Write before reading so that, on SQLite, the statement takes the
+        # database write lock instead of a read lock it may fail to upgrade.
+        updated = cls.objects.filter(name=name).update(
+            row=row, updated_at=timezone.now()
+        )
+        if not updated:
+            cls.objects.create(name=name, row=row)
+
+
+def ledger_order(log):
+    return (log.transaction_time, log.pk)
@@ -0,0 +1,110 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination over (transaction_time, id).
+
+    The cursor encodes the position of the last row of the previous page, and
+    each page is fetched with a range condition on the ordering columns, so
+    every page costs the same index seek no matter how deep it is.
+    """
+
+    ordering = ("transaction_time", "id")
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        return self.build_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        Async counterpart of paginate_queryset() for async views.
+        """
+        queryset = self.get_page_queryset(queryset, request)
+        return self.build_page([row async for row in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            time, pk = position
+            queryset = queryset.filter(transaction_time__gte=time).exclude(
+                transaction_time=time, id__lte=pk
+            )
+        # One extra row tells whether another page follows.
+        return queryset[: self.page_size + 1]
+
+    def build_page(self, page):
+        self.has_next = len(page) > self.page_size
+        page = page[: self.page_size]
+        self.next_position = (
+            (page[-1].transaction_time, page[-1].pk) if self.has_next else None
+        )
+        return page
+
+    def get_page_size(self, request):
+        page_size = settings.TRANSACTION_PAGE_SIZE
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        if requested > 0:
+            page_size = min(requested, settings.TRANSACTION_MAX_PAGE_SIZE)
+        return page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            time, pk = json.loads(urlsafe_b64decode(encoded.encode()))
+            time = parse_datetime(time)
+            pk = int(pk)
+        except (BinasciiError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if time is None:
+            raise NotFound(self.invalid_cursor_message)
+        return time, pk
+
+    def encode_cursor(self, position):
+        time, pk = position
+        encoded = urlsafe_b64encode(json.dumps([time.isoformat(), pk]).encode())
+        return encoded.decode()
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
@@ -0,0 +1,280 @@
+import csv
+import json
+import random
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+
+class RateProviderError(Exception):
+    """
+    Raised by a provider that cannot supply a rate table.
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling the provider while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing provider for `reset_timeout` seconds once
+    `failure_threshold` consecutive calls have failed. After the timeout a
+    single trial call is let through; its outcome closes or reopens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self._opened_at >= self.reset_timeout
+            ):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class ExchangeRateClient:
+    """
+    HTTP client for the exchangerate-api `latest` endpoint.
+
+    Connections are pooled and kept alive through one requests.Session. Every
+    call is bounded by connect/read timeouts and retried up to `retries` times
+    with jittered exponential backoff, and a circuit breaker fails fast while
+    the provider is down.
+    """
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        base_url,
+        api_key,
+        connect_timeout=3.05,
+        read_timeout=5,
+        retries=2,
+        backoff=0.25,
+        pool_size=10,
+        breaker=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def latest(self, base_currency):
+        """
+        Return the `conversion_rates` table quoted against `base_currency`.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Exchange rate provider circuit is open")
+
+        url = f"{self.base_url}/{self.api_key}/latest/{base_currency}"
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                response.raise_for_status()
+                rates = response.json()["conversion_rates"]
+            except requests.exceptions.HTTPError as e:
+                if e.response.status_code not in self.RETRY_STATUS_CODES:
+                    self.breaker.record_failure()
+                    raise
+                error = e
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                error = e
+            else:
+                self.breaker.record_success()
+                return rates
+
+            if attempt < self.retries:
+                time.sleep(random.uniform(0, self.backoff * 2**attempt))
+
+        self.breaker.record_failure()
+        if isinstance(error, requests.exceptions.RequestException):
+            raise error
+        raise requests.exceptions.RequestException(str(error)) from error
+
+
+class RateProvider:
+    """
+    Source of exchange rate tables.
+
+    Subclasses implement `fetch_rates(base_currency)`, returning a mapping of
+    currency code to the rate quoted against `base_currency`, and raise
+    RateProviderError when no table is available.
+    """
+
+    name = "base"
+
+    def fetch_rates(self, base_currency):
+        raise NotImplementedError
+
+
+def rebase_rates(rates, source_base, base_currency):
+    """
+    Requote a rate table from `source_base` to `base_currency`.
+    """
+    if source_base == base_currency:
+        return dict(rates)
+    pivot = rates.get(base_currency)
+    if not pivot:
+        raise RateProviderError(
+            f"No {base_currency} rate to requote a {source_base} table"
+        )
+    return {currency: rate / pivot for currency, rate in rates.items()}
+
+
+class HTTPRateProvider(RateProvider):
+    """
+    Rates from the exchangerate-api `latest` endpoint.
+    """
+
+    name = "http"
+
+    def __init__(self):
+        self.client = ExchangeRateClient(
+            base_url=settings.EXCHANGE_RATE_API_URL,
+            api_key=settings.EXCHANGE_RATE_API_KEY,
+            connect_timeout=settings.EXCHANGE_RATE_CONNECT_TIMEOUT,
+            read_timeout=settings.EXCHANGE_RATE_READ_TIMEOUT,
+            retries=settings.EXCHANGE_RATE_RETRIES,
+            backoff=settings.EXCHANGE_RATE_RETRY_BACKOFF,
+            pool_size=settings.EXCHANGE_RATE_POOL_SIZE,
+            breaker=CircuitBreaker(
+                failure_threshold=settings.EXCHANGE_RATE_CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=settings.EXCHANGE_RATE_CIRCUIT_RESET_TIMEOUT,
+            ),
+        )
+
+    def fetch_rates(self, base_currency):
+        try:
+            return self.client.latest(base_currency)
+        except (requests.exceptions.RequestException, CircuitOpenError) as e:
+            raise RateProviderError(str(e)) from e
+
+
+class FileRateProvider(RateProvider):
+    """
+    Rates from the local file named by EXCHANGE_RATE_FILE.
+
+    A `.json` file holds either an exchangerate-api style document with
+    `base_code` and `conversion_rates`, or a flat currency -> rate mapping
+    quoted against EXCHANGE_RATE_BASE_CURRENCY. A `.csv` file has
+    `currency,rate` columns and an optional `base` column.
+    """
+
+    name = "file"
+
+    def __init__(self, path=None):
+        self.path = Path(path or settings.EXCHANGE_RATE_FILE)
+
+    def fetch_rates(self, base_currency):
+        try:
+            if self.path.suffix.lower() == ".csv":
+                source_base, rates = self._read_csv()
+            else:
+                source_base, rates = self._read_json()
+        except (OSError, ValueError, KeyError) as e:
+            raise RateProviderError(f"Cannot read {self.path}: {e}") from e
+        return rebase_rates(rates, source_base, base_currency)
+
+    def _read_json(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        if "conversion_rates" in data:
+            return data["base_code"], data["conversion_rates"]
+        return settings.EXCHANGE_RATE_BASE_CURRENCY, data
+
+    def _read_csv(self):
+        source_base = settings.EXCHANGE_RATE_BASE_CURRENCY
+        rates = {}
+        with open(self.path, newline="") as f:
+            for row in csv.DictReader(f):
+                rates[row["currency"]] = float(row["rate"])
+                source_base = row.get("base") or source_base
+        return source_base, rates
+
+
+class DatabaseRateProvider(RateProvider):
+    """
+    Rates maintained in the ExchangeRate table.
+    """
+
+    name = "database"
+
+    def fetch_rates(self, base_currency):
+        from accounts.models import ExchangeRate
+
+        try:
+            # A savepoint keeps a failed read from breaking the caller's
+            # transaction, so the next provider can still be tried.
+            with transaction.atomic():
+                rows = list(
+                    ExchangeRate.objects.values_list(
+                        "base_currency", "currency", "rate"
+                    )
+                )
+        except DatabaseError as e:
+            raise RateProviderError(f"Cannot read the exchange rate table: {e}") from e
+        if not rows:
+            raise RateProviderError("The exchange rate table is empty")
+        bases = {base for base, _, _ in rows}
+        source_base = base_currency if base_currency in bases else rows[0][0]
+        rates = {currency: rate for base, currency, rate in rows if base == source_base}
+        rates.setdefault(source_base, 1.0)
+        return rebase_rates(rates, source_base, base_currency)
+
+
+@lru_cache(maxsize=None)
+def _load_rate_providers(backends):
+    return [import_string(backend)() for backend in backends]
+
+
+def get_rate_providers():
+    """
+    Return the provider instances configured in EXCHANGE_RATE_PROVIDERS, in
+    fallback order. Instances are shared so the HTTP connection pool and
+    circuit breaker live for the whole process.
+    """
+    return _load_rate_providers(tuple(settings.EXCHANGE_RATE_PROVIDERS))
@@ -0,0 +1,25 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renders data as newline-delimited JSON: one line per item of a list, or a
+    single line for anything else.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        items = data if isinstance(data, list) else [data]
+        return b"".join(ndjson_line(item) for item in items)
+
+
+def ndjson_line(item):
+    return (json.dumps(item, cls=JSONEncoder) + "\n").encode()
@@ -27,9 +27,41 @@ class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = "__all__"
+        read_only_fields = ["transaction_time"]
+
+
+class BulkTransactionSerializer(serializers.ModelSerializer):
+    """
+    Validates one item of a bulk submission. The account is taken as a plain
+    id; accounts without a wallet are reported when the batch is applied, so
+    validation does not query the database per item.
+    """
+
+    account = serializers.IntegerField(source="account_id")
+
+    class Meta:
+        model = Transaction
+        fields = [
+            "account",
+            "transaction_amount",
+            "transaction_amount_currency",
+            "transaction_type",
+        ]
 
 
 class TransactionLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = TransactionLog
         fields = "__all__"
+
+
+class TransactionImportSerializer(BulkTransactionSerializer):
+    """
+    Validates one row of an offline import, which may carry its original
+    transaction time.
+    """
+
+    transaction_time = serializers.DateTimeField(required=False)
+
+    class Meta(BulkTransactionSerializer.Meta):
+        fields = BulkTransactionSerializer.Meta.fields + ["transaction_time"]
@@ -1,5 +1,6 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from .cache import invalidate_account_caches
 from .models import Account, Wallet
 
 
@@ -11,3 +12,14 @@ def create_wallet(sender, instance, created, **kwargs):
     """
     if created and not hasattr(instance, "wallet"):
         Wallet.objects.create(account=instance, currency=instance.preferred_currency)
+
+
+@receiver([post_save, post_delete], sender=Account)
+@receiver([post_save, post_delete], sender=Wallet)
+def invalidate_cached_balance(sender, instance, **kwargs):
+    """
+    Signal receiver function to drop the cached balance payload when the
+    owner details or the wallet (e.g. its currency) change.
+    """
+    account_id = instance.pk if sender is Account else instance.account_id
+    invalidate_account_caches([account_id])
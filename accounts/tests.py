@@ -1,8 +1,45 @@
-from django.test import TestCase
+import copy
+import csv
+import json
+import logging
+import logging.config
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
+
+import requests
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection
+from django.db import transaction as db_transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.urls import reverse
-from accounts.models import Account, Wallet, Transaction, TransactionLog
+from accounts.cache import cache_balance, get_cache_generation
+from accounts.ledger import TransactionLogWriter
+from accounts.management.commands import reconcile_wallets
+from accounts.metrics import MetricsRegistry, metrics
+from accounts.models import (
+    Account,
+    DailyBalanceSnapshot,
+    ExchangeRate,
+    ExchangeRateSnapshot,
+    ImportCheckpoint,
+    Wallet,
+    Transaction,
+    TransactionLog,
+)
+from accounts.views import build_balance_payload
 from accounts.serializers import (
     AccountSerializer,
     TransactionSerializer,
@@ -12,6 +49,32 @@ from accounts.serializers import (
 from django.contrib.auth.models import User
 from rest_framework_simplejwt.tokens import AccessToken
 from django.utils.timezone import now
+from accounts.constants import (
+    CREDIT,
+    DEBIT,
+    TRANSACTION_STATUS_FAILED,
+    TRANSACTION_STATUS_SUCCESS,
+)
+from accounts.providers import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DatabaseRateProvider,
+    ExchangeRateClient,
+    FileRateProvider,
+    RateProviderError,
+)
+from transaction_project.log_handlers import JSONFormatter, QueuedRotatingFileHandler
+from accounts import utils
+from accounts.utils import (
+    RateCache,
+    RateRefresher,
+    RateTable,
+    aconvert_currency,
+    fetch_conversion_rates,
+    get_exchange_rate,
+    record_rate_snapshot,
+    get_rate_table,
+)
 
 
 class CreateAccountViewTest(TestCase):
@@ -187,3 +250,1828 @@ class AccountListAPIViewTest(TestCase):
         url = reverse("account-list")
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class RateCacheTest(TestCase):
+    def setUp(self):
+        self.cache = RateCache(ttl=60, maxsize=2)
+
+    def test_hit_and_miss_counters(self):
+        self.assertIsNone(self.cache.get("EUR"))
+        self.cache.set("EUR", {"USD": 1.1})
+        self.assertEqual(self.cache.get("EUR"), {"USD": 1.1})
+        self.assertEqual(
+            self.cache.stats(), {"hits": 1, "misses": 1, "stale_hits": 0, "size": 1}
+        )
+
+    def test_expired_entry_is_a_miss(self):
+        self.cache.set("EUR", {"USD": 1.1})
+        with mock.patch(
+            "accounts.utils.time.monotonic", return_value=time.monotonic() + 61
+        ):
+            self.assertIsNone(self.cache.get("EUR"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set("EUR", {"USD": 1.1})
+        self.cache.set("USD", {"EUR": 0.9})
+        self.cache.get("EUR")
+        self.cache.set("GBP", {"EUR": 1.2})
+        self.assertIsNone(self.cache.get("USD"))
+        self.assertIsNotNone(self.cache.get("EUR"))
+
+    def test_get_exchange_rate_fetches_one_table_for_all_pairs(self):
+        rates = RateTable({"EUR": 1.0, "USD": 1.1, "GBP": 0.85}, "EUR")
+        with mock.patch("accounts.utils.rate_cache", self.cache), mock.patch(
+            "accounts.utils.fetch_conversion_rates", return_value=rates
+        ) as fetch:
+            self.assertEqual(get_exchange_rate("EUR", "USD"), 1.1)
+            self.assertAlmostEqual(get_exchange_rate("USD", "GBP"), 0.85 / 1.1)
+            self.assertAlmostEqual(get_exchange_rate("GBP", "EUR"), 1 / 0.85)
+            self.assertIsNone(get_exchange_rate("EUR", "XYZ"))
+        fetch.assert_called_once_with("EUR")
+
+
+@override_settings(EXCHANGE_RATE_MAX_STALENESS=120)
+class RateRefreshTest(TestCase):
+    def setUp(self):
+        self.cache = RateCache(ttl=60, maxsize=2)
+        self.cache.set("EUR", {"EUR": 1.0, "USD": 1.1})
+        patcher = mock.patch("accounts.utils.rate_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expire(self, seconds):
+        return mock.patch(
+            "accounts.utils.time.monotonic", return_value=time.monotonic() + seconds
+        )
+
+    def test_stale_table_served_when_refresh_fails(self):
+        with self.expire(90), mock.patch(
+            "accounts.utils.fetch_conversion_rates", return_value=None
+        ):
+            self.assertEqual(get_rate_table("EUR"), {"EUR": 1.0, "USD": 1.1})
+
+    def test_table_beyond_max_staleness_is_not_served(self):
+        with self.expire(200), mock.patch(
+            "accounts.utils.fetch_conversion_rates", return_value=None
+        ):
+            self.assertIsNone(get_rate_table("EUR"))
+
+    def test_stale_table_served_without_fetch_while_refresher_runs(self):
+        with self.expire(90), mock.patch(
+            "accounts.utils.rate_refresher.is_alive", return_value=True
+        ), mock.patch("accounts.utils.fetch_conversion_rates") as fetch:
+            self.assertEqual(get_rate_table("EUR"), {"EUR": 1.0, "USD": 1.1})
+        fetch.assert_not_called()
+
+    def test_refresher_reloads_table(self):
+        refreshed = threading.Event()
+
+        def fetch(base_currency):
+            refreshed.set()
+            return RateTable({"EUR": 1.0, "USD": 1.2}, base_currency)
+
+        refresher = RateRefresher(interval=60)
+        with mock.patch(
+            "accounts.utils.fetch_conversion_rates", side_effect=fetch
+        ), mock.patch("accounts.utils.record_rate_snapshot"):
+            refresher.start()
+            self.assertTrue(refreshed.wait(5))
+            refresher.stop()
+            refresher.join(5)
+        self.assertEqual(self.cache.get("EUR"), {"EUR": 1.0, "USD": 1.2})
+
+    def test_refresher_survives_unexpected_errors(self):
+        calls = []
+        refreshed = threading.Event()
+
+        def fetch(base_currency):
+            calls.append(base_currency)
+            if len(calls) == 1:
+                raise RuntimeError("unexpected")
+            refreshed.set()
+            return RateTable({"EUR": 1.0, "USD": 1.3}, base_currency)
+
+        refresher = RateRefresher(interval=60, retry_interval=0)
+        with mock.patch(
+            "accounts.utils.fetch_conversion_rates", side_effect=fetch
+        ), mock.patch("accounts.utils.record_rate_snapshot"), self.assertLogs(
+            "accounts.utils", "ERROR"
+        ) as logs:
+            refresher.start()
+            self.assertTrue(refreshed.wait(5))
+            refresher.stop()
+            refresher.join(5)
+        self.assertIn("Exchange rate refresh failed", logs.output[0])
+        self.assertEqual(self.cache.get("EUR"), {"EUR": 1.0, "USD": 1.3})
+
+
+class StubRateHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.client_address, self.path))
+        status_code, delay = server.responses.pop(0) if server.responses else (200, 0)
+        if delay:
+            time.sleep(delay)
+        body = json.dumps({"conversion_rates": {"EUR": 1.0, "USD": 1.1}}).encode()
+        try:
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client already gave up on a deliberately slow response.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ExchangeRateClientTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubRateHandler)
+        self.server.requests = []
+        self.server.responses = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        self.client = ExchangeRateClient(
+            base_url=f"http://127.0.0.1:{self.server.server_port}/v6",
+            api_key="test-key",
+            read_timeout=0.2,
+            retries=1,
+            backoff=0.01,
+            breaker=self.breaker,
+        )
+
+    def test_latest_reuses_pooled_connection(self):
+        self.assertEqual(self.client.latest("EUR"), {"EUR": 1.0, "USD": 1.1})
+        self.client.latest("EUR")
+        self.assertEqual(self.server.requests[0][1], "/v6/test-key/latest/EUR")
+        self.assertEqual(len({address for address, _ in self.server.requests}), 1)
+
+    def test_server_error_is_retried(self):
+        self.server.responses = [(503, 0)]
+        self.assertEqual(self.client.latest("EUR"), {"EUR": 1.0, "USD": 1.1})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_client_error_is_not_retried(self):
+        self.server.responses = [(403, 0)]
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.client.latest("EUR")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_slow_provider_times_out(self):
+        self.server.responses = [(200, 0.5), (200, 0.5)]
+        started = time.monotonic()
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.client.latest("EUR")
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_circuit_opens_and_fails_fast(self):
+        self.server.responses = [(500, 0)] * 4
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.HTTPError):
+                self.client.latest("EUR")
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.client.latest("EUR")
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_half_open_trial_closes_circuit(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        with mock.patch(
+            "accounts.providers.time.monotonic", return_value=time.monotonic() + 61
+        ):
+            self.assertEqual(self.client.latest("EUR"), {"EUR": 1.0, "USD": 1.1})
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+class FailingRateProvider:
+    name = "failing"
+
+    def fetch_rates(self, base_currency):
+        raise RateProviderError("unavailable")
+
+
+class RateProviderTest(TestCase):
+    def write_rate_file(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def test_json_file_in_api_format_is_rebased(self):
+        path = self.write_rate_file(
+            "rates.json",
+            json.dumps(
+                {"base_code": "USD", "conversion_rates": {"USD": 1, "EUR": 0.5}}
+            ),
+        )
+        rates = FileRateProvider(path).fetch_rates("EUR")
+        self.assertEqual(rates, {"USD": 2.0, "EUR": 1.0})
+
+    def test_csv_file(self):
+        path = self.write_rate_file("rates.csv", "currency,rate\nEUR,1\nUSD,1.1\n")
+        self.assertEqual(
+            FileRateProvider(path).fetch_rates("EUR"), {"EUR": 1.0, "USD": 1.1}
+        )
+
+    def test_missing_file_raises_provider_error(self):
+        with self.assertRaises(RateProviderError):
+            FileRateProvider("/nonexistent/rates.json").fetch_rates("EUR")
+
+    def test_database_provider(self):
+        ExchangeRate.objects.create(base_currency="EUR", currency="USD", rate=1.1)
+        self.assertEqual(
+            DatabaseRateProvider().fetch_rates("EUR"), {"EUR": 1.0, "USD": 1.1}
+        )
+
+    def test_empty_database_raises_provider_error(self):
+        with self.assertRaises(RateProviderError):
+            DatabaseRateProvider().fetch_rates("EUR")
+
+    def test_database_error_falls_back_to_next_provider(self):
+        path = self.write_rate_file("rates.csv", "currency,rate\nEUR,1\nUSD,1.2\n")
+        providers = [DatabaseRateProvider(), FileRateProvider(path)]
+        with mock.patch(
+            "accounts.utils.get_rate_providers", return_value=providers
+        ), mock.patch.object(
+            ExchangeRate.objects,
+            "values_list",
+            side_effect=OperationalError("database is locked"),
+        ), self.assertLogs(
+            "accounts.utils", "WARNING"
+        ) as logs:
+            rates = fetch_conversion_rates("EUR")
+        self.assertEqual(rates.source, "file")
+        self.assertEqual(rates, {"EUR": 1.0, "USD": 1.2})
+        self.assertIn("Cannot read the exchange rate table", logs.output[0])
+
+    @override_settings(
+        EXCHANGE_RATE_PROVIDERS=[
+            "accounts.tests.FailingRateProvider",
+            "accounts.providers.DatabaseRateProvider",
+        ]
+    )
+    def test_falls_back_to_next_provider(self):
+        ExchangeRate.objects.create(base_currency="EUR", currency="USD", rate=1.1)
+        with self.assertLogs("accounts.utils", "WARNING") as logs:
+            rates = fetch_conversion_rates("EUR")
+        self.assertEqual(rates, {"EUR": 1.0, "USD": 1.1})
+        self.assertIn("Error fetching exchange rates from failing", logs.output[0])
+
+
+@override_settings(EXCHANGE_RATE_PROVIDERS=["accounts.providers.DatabaseRateProvider"])
+class ExchangeRateSnapshotTest(TestCase):
+    def setUp(self):
+        patcher = mock.patch("accounts.utils.rate_cache", RateCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ExchangeRate.objects.create(base_currency="EUR", currency="USD", rate=2.0)
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+
+    def test_transaction_records_snapshot_used(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_rate_table()
+        transaction = Transaction.objects.create(
+            account=self.account,
+            transaction_amount=10,
+            transaction_amount_currency="USD",
+            transaction_type=CREDIT,
+        )
+        snapshot = ExchangeRateSnapshot.objects.get()
+        self.assertEqual(snapshot.rates, {"EUR": 1.0, "USD": 2.0})
+        self.assertEqual(snapshot.source, "database")
+        self.assertEqual(transaction.rate_snapshot, snapshot)
+        log = TransactionLog.objects.get(account=self.account)
+        self.assertEqual(log.rate_snapshot, snapshot)
+        self.assertEqual(log.converted_amount, 5.0)
+
+    def test_as_of_returns_snapshot_current_at_time(self):
+        t0 = now()
+        older = ExchangeRateSnapshot.objects.create(
+            rates={"EUR": 1.0, "USD": 2.0}, fetched_at=t0 - timedelta(hours=2)
+        )
+        newer = ExchangeRateSnapshot.objects.create(
+            rates={"EUR": 1.0, "USD": 4.0}, fetched_at=t0 - timedelta(hours=1)
+        )
+        self.assertIsNone(ExchangeRateSnapshot.as_of(t0 - timedelta(hours=3)))
+        self.assertEqual(ExchangeRateSnapshot.as_of(t0 - timedelta(minutes=90)), older)
+        self.assertEqual(ExchangeRateSnapshot.as_of(t0), newer)
+        self.assertEqual(newer.convert(8, "USD", "EUR"), 2.0)
+
+    def test_failed_snapshot_write_is_logged(self):
+        rates = RateTable({"EUR": 1.0}, "EUR", source="database")
+        # A real failing INSERT inside the test's transaction.
+        with mock.patch.object(
+            ExchangeRateSnapshot._meta, "db_table", "accounts_missing_table"
+        ), self.assertLogs("accounts.utils", "ERROR") as logs:
+            self.assertIsNone(record_rate_snapshot(rates))
+        self.assertIn("Error recording exchange rate snapshot", logs.output[0])
+        self.assertIsNone(rates.snapshot_id)
+        # The enclosing transaction is still usable.
+        self.assertTrue(Account.objects.filter(pk=self.account.pk).exists())
+
+    def test_table_fetched_in_transaction_links_snapshot_at_once(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            rates = get_rate_table()
+            self.assertEqual(rates.snapshot_id, ExchangeRateSnapshot.objects.get().pk)
+            transaction = Transaction.objects.create(
+                account=self.account,
+                transaction_amount=10,
+                transaction_amount_currency="USD",
+                transaction_type=CREDIT,
+            )
+            self.assertEqual(transaction.rate_snapshot_id, rates.snapshot_id)
+            # Other threads only see the table once the snapshot commits.
+            self.assertIsNone(utils.rate_cache.get("EUR"))
+        for callback in callbacks:
+            callback()
+        self.assertIs(utils.rate_cache.get("EUR"), rates)
+
+    def test_rolled_back_table_is_dropped(self):
+        with self.assertRaises(RuntimeError):
+            with db_transaction.atomic():
+                rates = get_rate_table()
+                raise RuntimeError("request failed")
+        self.assertFalse(ExchangeRateSnapshot.objects.exists())
+        refetched = get_rate_table()
+        self.assertIsNot(refetched, rates)
+        self.assertEqual(refetched.snapshot_id, ExchangeRateSnapshot.objects.get().pk)
+
+
+class TransactionSaveTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        Wallet.objects.filter(account=self.account).update(balance=100)
+
+    def create_transaction(self, amount, transaction_type):
+        return Transaction.objects.create(
+            account=self.account,
+            transaction_amount=amount,
+            transaction_amount_currency="EUR",
+            transaction_type=transaction_type,
+        )
+
+    def test_credit_and_debit_update_balance(self):
+        self.create_transaction(50, CREDIT)
+        debit = self.create_transaction(120, DEBIT)
+        self.assertEqual(debit.transaction_status, TRANSACTION_STATUS_SUCCESS)
+        self.assertEqual(debit.current_balance, 30)
+        self.assertEqual(Wallet.objects.get(account=self.account).balance, 30)
+
+    def test_overdraft_fails_without_changing_balance(self):
+        debit = self.create_transaction(150, DEBIT)
+        self.assertEqual(debit.transaction_status, TRANSACTION_STATUS_FAILED)
+        self.assertEqual(debit.current_balance, 100)
+        self.assertEqual(Wallet.objects.get(account=self.account).balance, 100)
+        log = TransactionLog.objects.get(account=self.account)
+        self.assertEqual(log.transaction_status, TRANSACTION_STATUS_FAILED)
+
+    def test_time_stamped_after_wallet_update(self):
+        locked_at = []
+        original_apply = Transaction.apply_to_wallet
+
+        def apply_then_record(transaction, *args):
+            original_apply(transaction, *args)
+            locked_at.append(now())
+
+        with mock.patch.object(Transaction, "apply_to_wallet", apply_then_record):
+            credit = self.create_transaction(10, CREDIT)
+        self.assertGreaterEqual(credit.transaction_time, locked_at[0])
+        log = TransactionLog.objects.get(account=self.account)
+        self.assertEqual(log.transaction_time, credit.transaction_time)
+
+    def test_bulk_apply_stamps_missing_times_only(self):
+        imported_at = datetime(2024, 1, 2, 10, tzinfo=dt_timezone.utc)
+        pending = [
+            Transaction(
+                account=self.account,
+                transaction_amount=5,
+                transaction_type=CREDIT,
+                transaction_time=imported_at,
+            ),
+            Transaction(
+                account=self.account, transaction_amount=5, transaction_type=CREDIT
+            ),
+        ]
+        self.assertIsNone(pending[1].transaction_time)
+        before = now()
+        imported, live = Transaction.bulk_apply(pending)
+        self.assertEqual(imported.transaction_time, imported_at)
+        self.assertGreaterEqual(live.transaction_time, before)
+
+    def test_debit_guard_uses_current_row_not_loaded_wallet(self):
+        # Another writer drains the wallet after this save loaded it.
+        original_get = Wallet.objects.get
+
+        def get_then_drain(*args, **kwargs):
+            wallet = original_get(*args, **kwargs)
+            Wallet.objects.filter(pk=wallet.pk).update(balance=10)
+            return wallet
+
+        with mock.patch.object(Wallet.objects, "get", side_effect=get_then_drain):
+            debit = self.create_transaction(60, DEBIT)
+        self.assertEqual(debit.transaction_status, TRANSACTION_STATUS_FAILED)
+        self.assertEqual(Wallet.objects.get(account=self.account).balance, 10)
+
+    def test_bulk_apply_locks_wallets_in_key_order(self):
+        other = Account.objects.create(
+            first_name="Alan", last_name="Turing", email="alan@example.com"
+        )
+        batch = [
+            Transaction(
+                account=account,
+                transaction_amount=1,
+                transaction_amount_currency="EUR",
+                transaction_type=CREDIT,
+            )
+            for account in (other, self.account)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            Transaction.bulk_apply(batch)
+        statements = [
+            query["sql"]
+            for query in queries.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        lock_reads = [
+            sql
+            for sql in statements
+            if sql.startswith('SELECT "accounts_wallet"."id"')
+            and 'FROM "accounts_wallet"' in sql
+        ]
+        self.assertEqual(len(lock_reads), 1)
+        self.assertIn('ORDER BY "accounts_wallet"."id" ASC', lock_reads[0])
+        if not connection.features.has_select_for_update:
+            # The write lock is taken before anything is read.
+            self.assertTrue(statements[0].startswith('UPDATE "accounts_wallet"'))
+
+
+@override_settings(EXCHANGE_RATE_PROVIDERS=["accounts.providers.DatabaseRateProvider"])
+class BulkTransactionViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        patcher = mock.patch("accounts.utils.rate_cache", RateCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        ExchangeRate.objects.create(base_currency="EUR", currency="USD", rate=2.0)
+        self.first = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        self.second = Account.objects.create(
+            first_name="Alan", last_name="Turing", email="alan@example.com"
+        )
+        Wallet.objects.filter(account=self.first).update(balance=100)
+
+    def item(self, account, amount, transaction_type, currency="EUR"):
+        return {
+            "account": account.pk,
+            "transaction_amount": amount,
+            "transaction_amount_currency": currency,
+            "transaction_type": transaction_type,
+        }
+
+    def test_bulk_submission_reports_each_item(self):
+        url = reverse("bulk-transaction")
+        data = [
+            self.item(self.first, 80, DEBIT),
+            self.item(self.first, 50, DEBIT),
+            self.item(self.second, 20, CREDIT, currency="USD"),
+            self.item(self.first, 40, CREDIT),
+            {"account": self.first.pk, "transaction_type": "refund"},
+            self.item(self.first, 10, CREDIT, currency="XYZ"),
+        ]
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["success", "failed", "success", "success", "invalid", "invalid"],
+        )
+        self.assertEqual(results[1]["transaction"]["current_balance"], 20)
+        self.assertEqual(results[3]["transaction"]["current_balance"], 60)
+        self.assertEqual(Wallet.objects.get(account=self.first).balance, 60)
+        self.assertEqual(Wallet.objects.get(account=self.second).balance, 10)
+        self.assertEqual(Transaction.objects.count(), 4)
+        self.assertEqual(TransactionLog.objects.count(), 4)
+        self.assertEqual(ExchangeRateSnapshot.objects.count(), 1)
+
+    def test_unknown_account_is_invalid(self):
+        url = reverse("bulk-transaction")
+        response = self.client.post(
+            url,
+            [{**self.item(self.first, 10, CREDIT), "account": 1000}],
+            format="json",
+        )
+        self.assertEqual(response.data["results"][0]["status"], "invalid")
+
+    def test_rejects_non_list_payload(self):
+        url = reverse("bulk-transaction")
+        response = self.client.post(
+            url, self.item(self.first, 10, CREDIT), format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(TRANSACTION_STREAM_CHUNK_SIZE=2)
+class TransactionStreamViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+
+    def test_stream_returns_one_result_per_line(self):
+        lines = [
+            json.dumps(
+                {
+                    "account": self.account.pk,
+                    "transaction_amount": 30,
+                    "transaction_type": CREDIT,
+                }
+            ),
+            "",
+            "{not json",
+            json.dumps(
+                {
+                    "account": self.account.pk,
+                    "transaction_amount": 50,
+                    "transaction_type": DEBIT,
+                }
+            ),
+            json.dumps(
+                {
+                    "account": self.account.pk,
+                    "transaction_amount": 10,
+                    "transaction_type": DEBIT,
+                }
+            ),
+        ]
+        response = self.client.post(
+            reverse("stream-transaction"),
+            data="\n".join(lines).encode(),
+            content_type="application/x-ndjson",
+            HTTP_ACCEPT="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(
+            [(result["line"], result["status"]) for result in results],
+            [(1, "success"), (3, "invalid"), (4, "failed"), (5, "success")],
+        )
+        self.assertEqual(results[3]["transaction"]["current_balance"], 20)
+        self.assertEqual(Wallet.objects.get(account=self.account).balance, 20)
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        response = self.client.post(
+            reverse("stream-transaction"),
+            data=b"{}",
+            content_type="application/x-ndjson",
+            HTTP_ACCEPT="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rejects_body_without_content_length(self):
+        response = self.client.generic(
+            "POST",
+            reverse("stream-transaction"),
+            content_type="application/x-ndjson",
+            HTTP_ACCEPT="application/x-ndjson",
+            HTTP_TRANSFER_ENCODING="chunked",
+        )
+        self.assertEqual(response.status_code, status.HTTP_411_LENGTH_REQUIRED)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_rejects_empty_body(self):
+        response = self.client.post(
+            reverse("stream-transaction"),
+            data=b"",
+            content_type="application/x-ndjson",
+            HTTP_ACCEPT="application/x-ndjson",
+            CONTENT_LENGTH="0",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            json.loads(response.content)["error"], "The request body is empty."
+        )
+
+
+class LoadTransactionsCommandTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_file(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def jsonl(self, *rows):
+        return "".join(json.dumps(row) + "\n" for row in rows)
+
+    def row(self, amount, transaction_type, **extra):
+        return {
+            "account": self.account.pk,
+            "transaction_amount": amount,
+            "transaction_type": transaction_type,
+            **extra,
+        }
+
+    def test_imports_jsonl_with_original_times(self):
+        path = self.write_file(
+            "history.jsonl",
+            self.jsonl(
+                self.row(100, CREDIT, transaction_time="2024-01-02T10:00:00Z"),
+                self.row(30, DEBIT, transaction_time="2024-01-03T10:00:00Z"),
+                {"account": self.account.pk, "transaction_type": "refund"},
+            ),
+        )
+        out = StringIO()
+        call_command("load_transactions", path, batch_size=2, stdout=out)
+        self.assertIn("2 succeeded, 0 failed, 1 invalid", out.getvalue())
+        self.assertIn('Row 3 invalid: {"transaction_type": ', out.getvalue())
+        self.assertIn("rows/s", out.getvalue())
+        self.assertEqual(Wallet.objects.get(account=self.account).balance, 70)
+        log = TransactionLog.objects.order_by("id").last()
+        self.assertEqual(log.transaction_time.isoformat(), "2024-01-03T10:00:00+00:00")
+        self.assertEqual(log.current_balance, 70)
+
+    def test_imports_csv(self):
+        path = self.write_file(
+            "history.csv",
+            "account,transaction_amount,transaction_type,transaction_time\n"
+            f"{self.account.pk},40,credit,\n"
+            f"{self.account.pk},50,debit,\n",
+        )
+        call_command("load_transactions", path, stdout=StringIO())
+        self.assertEqual(Wallet.objects.get(account=self.account).balance, 40)
+        self.assertEqual(
+            Transaction.objects.filter(
+                transaction_status=TRANSACTION_STATUS_FAILED
+            ).count(),
+            1,
+        )
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write_file(
+            "history.jsonl",
+            self.jsonl(self.row(10, CREDIT), self.row(20, CREDIT)),
+        )
+        call_command("load_transactions", path, checkpoint="history", stdout=StringIO())
+        self.assertEqual(ImportCheckpoint.last_row("history"), 2)
+        with open(path, "a") as f:
+            f.write(self.jsonl(self.row(5, CREDIT)))
+        call_command("load_transactions", path, checkpoint="history", stdout=StringIO())
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertEqual(Wallet.objects.get(account=self.account).balance, 35)
+        self.assertEqual(ImportCheckpoint.last_row("history"), 3)
+
+    def test_write_behind_import(self):
+        path = self.write_file(
+            "history.jsonl",
+            self.jsonl(
+                self.row(10, CREDIT),
+                self.row(20, CREDIT),
+                {"account": 1000, "transaction_amount": 5},
+                self.row(50, DEBIT),
+                self.row(5, DEBIT),
+            ),
+        )
+        out = StringIO()
+        with mock.patch.object(
+            ImportCheckpoint, "record", wraps=ImportCheckpoint.record
+        ) as record:
+            call_command(
+                "load_transactions",
+                path,
+                checkpoint="history",
+                batch_size=2,
+                write_behind=True,
+                stdout=out,
+            )
+        self.assertIn("3 succeeded, 1 failed, 1 invalid", out.getvalue())
+        self.assertIn("Row 3 invalid: ", out.getvalue())
+        self.assertEqual(Wallet.objects.get(account=self.account).balance, 25)
+        self.assertEqual(TransactionLog.objects.count(), 4)
+        # One checkpoint per committed writer batch, the last one on exit.
+        self.assertEqual([c.args[1] for c in record.call_args_list], [2, 5, 5])
+        self.assertEqual(ImportCheckpoint.last_row("history"), 5)
+
+    def test_batch_rolls_back_when_checkpoint_cannot_be_written(self):
+        path = self.write_file(
+            "history.jsonl",
+            self.jsonl(self.row(10, CREDIT), self.row(20, CREDIT)),
+        )
+        with mock.patch.object(
+            ImportCheckpoint, "record", side_effect=DatabaseError("disk full")
+        ):
+            with self.assertRaises(DatabaseError):
+                call_command(
+                    "load_transactions",
+                    path,
+                    checkpoint="history",
+                    batch_size=1,
+                    stdout=StringIO(),
+                )
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(ImportCheckpoint.last_row("history"), 0)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        other = Account.objects.create(
+            first_name="Alan", last_name="Turing", email="alan@example.com"
+        )
+        moment = now()
+        # Two rows share a timestamp so ties must be broken by id.
+        times = [moment, moment, moment + timedelta(seconds=1)]
+        times += [moment - timedelta(seconds=1), moment + timedelta(seconds=2)]
+        self.logs = [
+            TransactionLog.objects.create(
+                account=self.account,
+                transaction_time=time,
+                transaction_type=CREDIT,
+                transaction_amount=1,
+                current_balance=1,
+            )
+            for time in times
+        ]
+        TransactionLog.objects.create(
+            account=other,
+            transaction_type=CREDIT,
+            transaction_amount=1,
+            current_balance=1,
+        )
+
+    def collect_pages(self, url):
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [row["id"] for row in response.data["results"]]
+            url = response.data["next"]
+            pages += 1
+        return ids, pages
+
+    def test_account_history_pages_in_time_then_id_order(self):
+        url = reverse("create-transaction", args=[self.account.pk]) + "?page_size=2"
+        ids, pages = self.collect_pages(url)
+        expected = sorted(self.logs, key=lambda log: (log.transaction_time, log.pk))
+        self.assertEqual(ids, [log.pk for log in expected])
+        self.assertEqual(pages, 3)
+
+    def test_full_ledger_is_paginated(self):
+        ids, pages = self.collect_pages(reverse("transaction-list") + "?page_size=4")
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(pages, 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("transaction-list") + "?cursor=garbage")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@skipUnless(connection.vendor == "sqlite", "Checks SQLite query plans")
+class LedgerIndexTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index_name}", plan)
+        self.assertNotIn("USE TEMP B-TREE FOR ORDER BY", plan)
+
+    def test_account_history_uses_account_time_index(self):
+        queryset = TransactionLog.objects.filter(account=self.account).order_by(
+            "transaction_time", "id"
+        )
+        self.assertUsesIndex(queryset[:100], "accounts_txlog_acct_time_idx")
+        self.assertUsesIndex(
+            queryset.filter(transaction_time__gte=now()).exclude(
+                transaction_time=now(), id__lte=10
+            )[:100],
+            "accounts_txlog_acct_time_idx",
+        )
+
+    def test_balance_as_of_seeks_account_time_index(self):
+        queryset = TransactionLog.objects.filter(
+            account=self.account, transaction_time__lte=now()
+        ).order_by("-transaction_time", "-id")
+        self.assertUsesIndex(queryset[:1], "accounts_txlog_acct_time_idx")
+
+    def test_full_ledger_uses_time_index(self):
+        queryset = TransactionLog.objects.order_by("transaction_time", "id")
+        self.assertUsesIndex(queryset[:100], "accounts_txlog_time_idx")
+
+    def test_account_transactions_use_account_time_index(self):
+        queryset = Transaction.objects.filter(account=self.account).order_by(
+            "transaction_time", "id"
+        )
+        self.assertUsesIndex(queryset[:100], "accounts_tx_acct_time_idx")
+
+
+@override_settings(TRANSACTION_EXPORT_CHUNK_SIZE=2)
+class TransactionExportViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+
+    def create_logs(self, count):
+        return [
+            TransactionLog.objects.create(
+                account=self.account,
+                transaction_type=CREDIT,
+                transaction_amount=amount,
+                current_balance=amount,
+            )
+            for amount in range(count)
+        ]
+
+    def export(self):
+        response = self.client.get(reverse("transaction-export"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_export_streams_every_row_in_order(self):
+        logs = self.create_logs(5)
+        data = self.export()
+        self.assertEqual([row["id"] for row in data], [log.pk for log in logs])
+        self.assertEqual(data[0], TransactionLogSerializer(logs[0]).data)
+
+    def test_export_of_empty_ledger(self):
+        self.assertEqual(self.export(), [])
+
+
+@override_settings(TRANSACTION_EXPORT_CHUNK_SIZE=2)
+class TransactionCSVExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        other = Account.objects.create(
+            first_name="Alan", last_name="Turing", email="alan@example.com"
+        )
+        for day, account in [(1, self.account), (2, other), (2, self.account)]:
+            for amount in (10, 20):
+                TransactionLog.objects.create(
+                    account=account,
+                    transaction_time=datetime(2024, 3, day, 12, tzinfo=dt_timezone.utc),
+                    transaction_type=CREDIT,
+                    transaction_amount=amount,
+                    current_balance=amount,
+                )
+
+    def read_csv(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        content = b"".join(response.streaming_content).decode()
+        return list(csv.DictReader(StringIO(content)))
+
+    def test_full_ledger_export(self):
+        rows = self.read_csv(reverse("transaction-export-csv"))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]["transaction_time"], "2024-03-01T12:00:00+00:00")
+        self.assertEqual(rows[0]["transaction_amount"], "10.0")
+
+    def test_account_statement_with_date_range(self):
+        url = reverse("account-statement-csv", args=[self.account.pk])
+        rows = self.read_csv(url + "?start=2024-03-02&end=2024-03-02")
+        self.assertEqual(len(rows), 2)
+        self.assertEqual({row["account_id"] for row in rows}, {str(self.account.pk)})
+        self.assertEqual(len(self.read_csv(url + "?end=2024-03-02T00:00:00Z")), 2)
+
+    def test_invalid_range_and_unknown_account(self):
+        url = reverse("transaction-export-csv")
+        response = self.client.get(url + "?start=yesterday")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("account-statement-csv", args=[1000]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BalanceCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        self.url = reverse("show-balance", args=[self.account.pk])
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_balance_served_from_cache(self):
+        # One query authenticates the user, one loads wallet and owner.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["balance"], 0)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["account_owner"]["first_name"], "Ada")
+
+    def test_transaction_invalidates_cached_balance(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                account=self.account,
+                transaction_amount=25,
+                transaction_amount_currency="EUR",
+                transaction_type=CREDIT,
+            )
+        self.assertEqual(self.client.get(self.url).data["balance"], 25)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.bulk_apply(
+                [
+                    Transaction(
+                        account=self.account,
+                        transaction_amount=5,
+                        transaction_amount_currency="EUR",
+                        transaction_type=DEBIT,
+                    )
+                ]
+            )
+        self.assertEqual(self.client.get(self.url).data["balance"], 20)
+
+    def test_load_racing_a_write_is_not_served(self):
+        # A reader fetches the generation and the old wallet, then the write
+        # commits before the reader stores what it loaded.
+        generation = get_cache_generation(self.account.pk)
+        stale = build_balance_payload(
+            Wallet.objects.select_related("account").get(account=self.account)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                account=self.account,
+                transaction_amount=25,
+                transaction_amount_currency="EUR",
+                transaction_type=CREDIT,
+            )
+        cache_balance(self.account.pk, generation, stale)
+        self.assertEqual(self.client.get(self.url).data["balance"], 25)
+
+    def test_currency_change_invalidates_cached_balance(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.account.update_wallet_currency("USD")
+        self.assertEqual(self.client.get(self.url).data["wallet currency"], "USD")
+
+    def test_missing_account_and_wallet(self):
+        response = self.client.get(reverse("show-balance", args=[1000]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn("Account with id", response.data["error"])
+        with self.captureOnCommitCallbacks(execute=True):
+            Wallet.objects.filter(account=self.account).delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn("Wallet for account", response.data["error"])
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def credit(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                account=self.account,
+                transaction_amount=amount,
+                transaction_amount_currency="EUR",
+                transaction_type=CREDIT,
+            )
+
+    def test_balance_not_modified_until_transaction(self):
+        url = reverse("show-balance", args=[self.account.pk])
+        tag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+
+        self.credit(10)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], tag)
+
+    def test_history_not_modified_until_transaction(self):
+        self.credit(10)
+        url = reverse("create-transaction", args=[self.account.pk])
+        tag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # Other pages of the same history carry their own tag.
+        response = self.client.get(url + "?page_size=1", HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.credit(5)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_every_ledger_row_bumps_wallet_ledger_version(self):
+        self.credit(10)
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                account=self.account,
+                transaction_amount=50,
+                transaction_amount_currency="EUR",
+                transaction_type=DEBIT,
+            )
+            Transaction.bulk_apply(
+                [
+                    Transaction(
+                        account=self.account,
+                        transaction_amount=amount,
+                        transaction_amount_currency="EUR",
+                        transaction_type=DEBIT,
+                    )
+                    for amount in (5, 500)
+                ]
+            )
+        wallet = Wallet.objects.get(account=self.account)
+        self.assertEqual(wallet.ledger_version, 4)
+        self.assertEqual(wallet.balance, 5)
+        self.assertEqual(TransactionLog.objects.filter(account=self.account).count(), 4)
+
+    def test_history_etag_reads_wallet_ledger_version(self):
+        self.credit(10)
+        url = reverse("create-transaction", args=[self.account.pk])
+        tag = self.client.get(url)["ETag"]
+        # One query authenticates the user, one reads the ledger version.
+        with self.assertNumQueries(2):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=tag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_unknown_account_has_no_etag(self):
+        response = self.client.get(reverse("show-balance", args=[1000]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class AccountStatementSummaryTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        self.url = reverse("account-statement-summary", args=[self.account.pk])
+        rows = [
+            (datetime(2024, 3, 1, 9), CREDIT, TRANSACTION_STATUS_SUCCESS, 100, 100),
+            (datetime(2024, 3, 2, 9), DEBIT, TRANSACTION_STATUS_SUCCESS, 30, 70),
+            (datetime(2024, 3, 2, 10), DEBIT, TRANSACTION_STATUS_FAILED, 500, 70),
+            (datetime(2024, 4, 5, 9), CREDIT, TRANSACTION_STATUS_SUCCESS, 10, 80),
+        ]
+        for when, kind, outcome, amount, balance in rows:
+            TransactionLog.objects.create(
+                account=self.account,
+                transaction_time=when.replace(tzinfo=dt_timezone.utc),
+                transaction_type=kind,
+                transaction_status=outcome,
+                transaction_amount=amount,
+                converted_amount=amount,
+                current_balance=balance,
+            )
+
+    def test_monthly_summary(self):
+        # Authentication, account lookup, aggregation and closing balances.
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        march, april = response.data["results"]
+        self.assertEqual(str(march["period"]), "2024-03-01")
+        self.assertEqual(march["credits"], 100)
+        self.assertEqual(march["debits"], 30)
+        self.assertEqual(march["failed"], 1)
+        self.assertEqual(march["count"], 3)
+        self.assertEqual(march["closing_balance"], 70)
+        self.assertEqual(april["debits"], 0)
+        self.assertEqual(april["closing_balance"], 80)
+
+    def test_daily_summary_within_range(self):
+        response = self.client.get(
+            self.url + "?period=day&start=2024-03-02&end=2024-03-31"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        (day,) = response.data["results"]
+        self.assertEqual(str(day["period"]), "2024-03-02")
+        self.assertEqual(day["count"], 2)
+
+    def test_closing_balance_follows_transaction_time(self):
+        # An imported row applied late, but dated before the month's last row.
+        TransactionLog.objects.create(
+            account=self.account,
+            transaction_time=datetime(2024, 4, 1, 9, tzinfo=dt_timezone.utc),
+            transaction_type=CREDIT,
+            transaction_status=TRANSACTION_STATUS_SUCCESS,
+            transaction_amount=5,
+            converted_amount=5,
+            current_balance=85,
+        )
+        response = self.client.get(self.url)
+        march, april = response.data["results"]
+        self.assertEqual(march["closing_balance"], 70)
+        self.assertEqual(april["closing_balance"], 80)
+
+    def test_invalid_period_and_unknown_account(self):
+        response = self.client.get(self.url + "?period=year")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("account-statement-summary", args=[1000]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DailyBalanceSnapshotTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+
+    def apply(self, day, amount, transaction_type=CREDIT):
+        return Transaction.objects.create(
+            account=self.account,
+            transaction_time=datetime(2024, 3, day, 12, tzinfo=dt_timezone.utc),
+            transaction_amount=amount,
+            transaction_amount_currency="EUR",
+            transaction_type=transaction_type,
+        )
+
+    def closing_balances(self):
+        return dict(
+            DailyBalanceSnapshot.objects.filter(account=self.account)
+            .order_by("day")
+            .values_list("day__day", "closing_balance")
+        )
+
+    def test_snapshots_follow_transactions(self):
+        self.apply(1, 100)
+        self.apply(1, 30, DEBIT)
+        self.apply(3, 10)
+        self.assertEqual(self.closing_balances(), {1: 70, 3: 80})
+        snapshot = DailyBalanceSnapshot.objects.get(account=self.account, day__day=3)
+        self.assertEqual(snapshot.last_log.current_balance, 80)
+
+    def test_last_log_is_indexed(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, DailyBalanceSnapshot._meta.db_table
+            )
+        self.assertIn(
+            ["last_log_id"],
+            [c["columns"] for c in constraints.values() if c["index"]],
+        )
+
+    def test_bulk_apply_records_last_row_per_day(self):
+        Transaction.bulk_apply(
+            [
+                Transaction(
+                    account=self.account,
+                    transaction_time=datetime(2024, 3, day, 12, tzinfo=dt_timezone.utc),
+                    transaction_amount=amount,
+                    transaction_amount_currency="EUR",
+                    transaction_type=CREDIT,
+                )
+                for day, amount in [(1, 5), (1, 5), (2, 1)]
+            ]
+        )
+        self.assertEqual(self.closing_balances(), {1: 10, 2: 11})
+
+    def test_out_of_order_import_keeps_latest_row_of_day(self):
+        self.apply(1, 100)
+        Transaction.bulk_apply(
+            [
+                Transaction(
+                    account=self.account,
+                    transaction_time=datetime(2024, 3, 1, 9, tzinfo=dt_timezone.utc),
+                    transaction_amount=5,
+                    transaction_amount_currency="EUR",
+                    transaction_type=CREDIT,
+                )
+            ]
+        )
+        self.assertEqual(self.closing_balances(), {1: 100})
+        DailyBalanceSnapshot.objects.all().delete()
+        call_command("backfill_balance_snapshots", stdout=StringIO())
+        self.assertEqual(self.closing_balances(), {1: 100})
+
+    def test_balance_as_of_reads_nearest_snapshot(self):
+        self.apply(1, 100)
+        self.apply(1, 30, DEBIT)
+        self.apply(3, 10)
+        when = datetime(2024, 3, 2, 12, tzinfo=dt_timezone.utc)
+        # The day's ledger rows, then the snapshot of the day before.
+        with self.assertNumQueries(2):
+            log = DailyBalanceSnapshot.balance_as_of(self.account.pk, when)
+        self.assertEqual(log.current_balance, 70)
+        self.assertEqual(log, TransactionLog.as_of(self.account.pk, when))
+        log = DailyBalanceSnapshot.balance_as_of(
+            self.account.pk, datetime(2024, 3, 3, 13, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(log.current_balance, 80)
+
+    def test_backfill_command_rebuilds_snapshots(self):
+        self.apply(1, 100)
+        self.apply(2, 40, DEBIT)
+        DailyBalanceSnapshot.objects.all().delete()
+        call_command("backfill_balance_snapshots", stdout=StringIO())
+        self.assertEqual(self.closing_balances(), {1: 100, 2: 60})
+
+
+class AccountBalanceAsOfTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        self.url = reverse("balance-as-of", args=[self.account.pk])
+        for hour, balance in [(9, 100), (12, 70), (12, 90), (18, 40)]:
+            TransactionLog.objects.create(
+                account=self.account,
+                transaction_time=datetime(2024, 3, 1, hour, tzinfo=dt_timezone.utc),
+                transaction_type=CREDIT,
+                transaction_amount=10,
+                current_balance=balance,
+            )
+
+    def test_balance_at_moment(self):
+        # Authentication and the ledger seek.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url + "?at=2024-03-01T15:00:00Z")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["balance"], 90)
+        last_noon_row = TransactionLog.objects.filter(current_balance=90).get()
+        self.assertEqual(response.data["transaction_log"], last_noon_row.pk)
+
+        response = self.client.get(self.url + "?at=2024-03-01T18:00:00Z")
+        self.assertEqual(response.data["balance"], 40)
+
+    def test_balance_before_first_row(self):
+        response = self.client.get(self.url + "?at=2024-02-01T00:00:00Z")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["balance"], 0)
+        self.assertIsNone(response.data["transaction_log"])
+
+    def test_invalid_moment_and_unknown_account(self):
+        response = self.client.get(self.url + "?at=yesterday")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            reverse("balance-as-of", args=[1000]) + "?at=2024-03-01T00:00:00Z"
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ReconcileWalletsCommandTest(TestCase):
+    def setUp(self):
+        self.accounts = [
+            Account.objects.create(
+                first_name="Ada", last_name=str(i), email=f"ada{i}@example.com"
+            )
+            for i in range(3)
+        ]
+        for account in self.accounts:
+            for amount, transaction_type in [(100, CREDIT), (30, DEBIT), (500, DEBIT)]:
+                Transaction.objects.create(
+                    account=account,
+                    transaction_amount=amount,
+                    transaction_amount_currency="EUR",
+                    transaction_type=transaction_type,
+                )
+        self.drifted = self.accounts[1]
+        Wallet.objects.filter(account=self.drifted).update(balance=75)
+
+    def reconcile(self, *args):
+        out = StringIO()
+        call_command("reconcile_wallets", *args, accounts_per_chunk=2, stdout=out)
+        return out.getvalue()
+
+    def test_reports_drifted_wallets(self):
+        output = self.reconcile()
+        self.assertIn(
+            f"Account {self.drifted.pk}: wallet 75.00, ledger 70.00, delta +5.00",
+            output,
+        )
+        self.assertIn("Reconciled 3 wallets", output)
+        self.assertIn("1 drifted", output)
+        self.assertEqual(Wallet.objects.get(account=self.drifted).balance, 75)
+
+    def test_repair_sets_ledger_balance(self):
+        output = self.reconcile("--repair")
+        self.assertIn("1 repaired", output)
+        self.assertEqual(Wallet.objects.get(account=self.drifted).balance, 70)
+        self.assertIn("0 drifted", self.reconcile())
+
+    def test_transaction_between_reads_is_not_reported(self):
+        account = self.accounts[0]
+        ledger_balances = reconcile_wallets.ledger_balances
+
+        def apply_then_sum(*args, **kwargs):
+            if Transaction.objects.filter(transaction_amount=5).count() == 0:
+                # Lands after the wallets were read, before the ledger is.
+                Transaction.objects.create(
+                    account=account,
+                    transaction_amount=5,
+                    transaction_amount_currency="EUR",
+                    transaction_type=CREDIT,
+                )
+            return ledger_balances(*args, **kwargs)
+
+        with mock.patch.object(
+            reconcile_wallets, "ledger_balances", side_effect=apply_then_sum
+        ):
+            output = self.reconcile()
+        self.assertNotIn(f"Account {account.pk}:", output)
+        self.assertIn(f"Account {self.drifted.pk}:", output)
+        self.assertIn("1 drifted", output)
+
+
+class AsyncReadViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        Transaction.objects.create(
+            account=self.account,
+            transaction_amount=25,
+            transaction_amount_currency="EUR",
+            transaction_type=CREDIT,
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    async def test_balance_matches_sync_view(self):
+        url = reverse("async-show-balance", args=[self.account.pk])
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["balance"], 25)
+        self.assertEqual(response.json()["account_owner"]["first_name"], "Ada")
+
+        headers = {**self.headers, "If-None-Match": response["ETag"]}
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = await self.async_client.get(
+            reverse("async-show-balance", args=[1000]), headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_account_detail(self):
+        url = reverse("async-show-account", args=[self.account.pk])
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["wallet"]["balance"], 25)
+        response = await self.async_client.get(
+            reverse("async-show-account", args=[1000]), headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_transaction_history_pages(self):
+        url = reverse("async-account-transactions", args=[self.account.pk])
+        response = await self.async_client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        (row,) = response.json()["results"]
+        self.assertEqual(row["current_balance"], 25)
+        self.assertIsNone(response.json()["next"])
+
+        headers = {**self.headers, "If-None-Match": response["ETag"]}
+        response = await self.async_client.get(url, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = await self.async_client.get(
+            url + "?cursor=bad", headers=self.headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_requires_valid_token(self):
+        url = reverse("async-show-balance", args=[self.account.pk])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(
+            url, headers={"Authorization": "Bearer not-a-token"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_async_conversion_uses_cached_rates(self):
+        rates = RateCache()
+        rates.set("EUR", RateTable({"EUR": 1, "USD": 2}, "EUR"))
+        with mock.patch("accounts.utils.rate_cache", rates):
+            self.assertEqual(await aconvert_currency(10, "EUR", "USD"), 20)
+
+
+class TransactionLogWriterTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+
+    def credit(self, amount):
+        return Transaction.objects.create(
+            account=self.account,
+            transaction_amount=amount,
+            transaction_amount_currency="EUR",
+            transaction_type=CREDIT,
+        )
+
+    def test_logs_flushed_in_batches(self):
+        with TransactionLogWriter(batch_size=3, max_delay=60) as writer:
+            self.credit(1)
+            self.credit(2)
+            self.assertEqual(TransactionLog.objects.count(), 0)
+            self.credit(3)
+            self.assertEqual(TransactionLog.objects.count(), 3)
+            self.credit(4)
+            self.assertEqual(TransactionLog.objects.count(), 3)
+        self.assertEqual(writer.flushed, 4)
+        self.assertEqual(
+            list(
+                TransactionLog.objects.order_by("id").values_list(
+                    "current_balance", flat=True
+                )
+            ),
+            [1, 3, 6, 10],
+        )
+        self.assertEqual(
+            DailyBalanceSnapshot.objects.get(account=self.account).closing_balance, 10
+        )
+
+    def test_elapsed_window_flushes(self):
+        with TransactionLogWriter(batch_size=100, max_delay=0):
+            self.credit(1)
+            self.assertEqual(TransactionLog.objects.count(), 1)
+
+    def test_error_rolls_back_current_batch_only(self):
+        with self.assertRaises(RuntimeError):
+            with TransactionLogWriter(batch_size=2, max_delay=60):
+                self.credit(1)
+                self.credit(2)
+                self.credit(4)
+                raise RuntimeError("import aborted")
+        self.assertEqual(TransactionLog.objects.count(), 2)
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Wallet.objects.get(account=self.account).balance, 3)
+
+    def test_before_commit_runs_in_each_batch(self):
+        seen = []
+        with TransactionLogWriter(
+            batch_size=2,
+            max_delay=60,
+            before_commit=lambda: seen.append(TransactionLog.objects.count()),
+        ) as writer:
+            self.credit(1)
+            self.credit(2)
+            self.credit(4)
+            # An idle caller commits a batch whose window elapsed.
+            writer.max_delay = 0
+            self.assertTrue(writer.commit_if_due())
+        self.assertEqual(seen, [2, 3, 3])
+
+    def test_writers_do_not_nest(self):
+        with TransactionLogWriter():
+            with self.assertRaises(RuntimeError):
+                with TransactionLogWriter():
+                    pass
+
+
+class TransactionEventLogTest(TestCase):
+    def setUp(self):
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+
+    def test_save_emits_structured_event(self):
+        with self.assertLogs("transactions", "INFO") as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                transaction = Transaction.objects.create(
+                    account=self.account,
+                    transaction_amount=25,
+                    transaction_amount_currency="EUR",
+                    transaction_type=CREDIT,
+                )
+                self.assertEqual(
+                    [r.event["event"] for r in logs.records if hasattr(r, "event")],
+                    [],
+                )
+        event = logs.records[-1].event
+        self.assertEqual(event["event"], "transaction.saved")
+        self.assertEqual(event["transaction_id"], transaction.pk)
+        self.assertEqual(event["transaction_status"], TRANSACTION_STATUS_SUCCESS)
+        self.assertEqual(event["current_balance"], 25)
+        self.assertGreaterEqual(event["duration_ms"], 0)
+
+    def test_rolled_back_writer_batch_emits_nothing(self):
+        def credit(amount):
+            Transaction.objects.create(
+                account=self.account,
+                transaction_amount=amount,
+                transaction_amount_currency="EUR",
+                transaction_type=CREDIT,
+            )
+
+        with self.assertLogs("transactions", "INFO") as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError):
+                    with TransactionLogWriter(batch_size=2, max_delay=60):
+                        credit(1)
+                        credit(2)
+                        credit(4)
+                        raise RuntimeError("import aborted")
+        saved = [
+            r.event["current_balance"]
+            for r in logs.records
+            if getattr(r, "event", {}).get("event") == "transaction.saved"
+        ]
+        self.assertEqual(saved, [1, 3])
+
+    def test_queued_json_file_rotates_and_never_blocks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "transactions.log")
+            handler = QueuedRotatingFileHandler(path, maxBytes=300, backupCount=2)
+            handler.setFormatter(JSONFormatter())
+            logger = logging.getLogger("accounts.tests.queued")
+            logger.addHandler(handler)
+            logger.propagate = False
+            try:
+                for number in range(10):
+                    logger.warning("entry %d", number, extra={"event": {"n": number}})
+                # A stalled writer makes records drop instead of blocking.
+                handler.listener.stop()
+                handler.queue.maxsize = 2
+                for number in range(5):
+                    logger.warning("while stalled")
+                self.assertEqual(handler.dropped, 3)
+                handler.listener.start()
+            finally:
+                logger.removeHandler(handler)
+                handler.close()
+
+            self.assertTrue(os.path.exists(path + ".1"))
+            with open(path) as f:
+                entry = json.loads(f.readline())
+            self.assertEqual(entry["logger"], "accounts.tests.queued")
+            self.assertEqual(entry["level"], "WARNING")
+            self.assertIn("time", entry)
+
+    def test_settings_logging_config_writes_json_file(self):
+        config = copy.deepcopy(settings.LOGGING)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "transactions.log")
+            config["handlers"]["file"]["filename"] = path
+            try:
+                logging.config.dictConfig(config)
+                logging.getLogger("transactions").info(
+                    "configured", extra={"event": {"event": "test.configured"}}
+                )
+                for handler in logging.getLogger("transactions").handlers:
+                    handler.close()
+                with open(path) as f:
+                    entry = json.loads(f.readline())
+            finally:
+                logging.config.dictConfig(settings.LOGGING)
+        self.assertEqual(entry["logger"], "transactions")
+        self.assertEqual(entry["event"], "test.configured")
+        self.assertEqual(entry["message"], "configured")
+
+
+class MetricsRegistryTest(TestCase):
+    def test_shards_from_threads_are_merged(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.describe("jobs_total", "counter", "Jobs run.")
+
+        def work():
+            for _ in range(100):
+                registry.inc("jobs_total", {"queue": "fx"})
+            registry.observe("job_seconds", 0.5)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        registry.observe("job_seconds", 2)
+
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE jobs_total counter", lines)
+        self.assertIn('jobs_total{queue="fx"} 400', lines)
+        self.assertIn('job_seconds_bucket{le="0.1"} 0', lines)
+        self.assertIn('job_seconds_bucket{le="1.0"} 4', lines)
+        self.assertIn('job_seconds_bucket{le="+Inf"} 5', lines)
+        self.assertIn("job_seconds_sum 4.0", lines)
+        self.assertIn("job_seconds_count 5", lines)
+
+    def test_shards_of_exited_threads_are_retired(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+
+        def work():
+            registry.inc("jobs_total")
+            registry.observe("job_seconds", 0.5)
+
+        for _ in range(20):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        registry.inc("jobs_total")
+
+        self.assertEqual(len(registry._shards), 1)
+        counters, histograms = registry.collect()
+        self.assertEqual(counters, {("jobs_total", ()): 21})
+        self.assertEqual(histograms, {("job_seconds", ()): [0, 20, 0, 10.0]})
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        metrics.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+
+    def tearDown(self):
+        metrics.clear()
+
+    def scrape(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode().splitlines()
+
+    def test_requests_and_transactions_are_counted(self):
+        self.client.get(reverse("show-balance", args=[self.account.pk]))
+        with self.captureOnCommitCallbacks(execute=True):
+            Transaction.objects.create(
+                account=self.account,
+                transaction_amount=25,
+                transaction_amount_currency="EUR",
+                transaction_type=CREDIT,
+            )
+        lines = self.scrape()
+        self.assertIn(
+            'http_requests_total{method="GET",route="wallet/<int:account_id>/",'
+            'status="200"} 1',
+            lines,
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{route="wallet/<int:account_id>/"} 1',
+            lines,
+        )
+        # Authentication and the wallet lookup
+        self.assertIn(
+            'http_db_queries_total{route="wallet/<int:account_id>/"} 2', lines
+        )
+        self.assertIn('transactions_total{status="success",type="credit"} 1', lines)
+
+    def test_fx_calls_are_counted(self):
+        with mock.patch(
+            "accounts.utils.get_rate_providers",
+            return_value=[FailingRateProvider()],
+        ):
+            fetch_conversion_rates("EUR")
+        self.assertIn(
+            'fx_requests_total{outcome="error",provider="failing"} 1', self.scrape()
+        )
+
+    def test_requires_authentication(self):
+        self.client.credentials()
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser", password="testpassword"
+        )
+        self.token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(self.token))
+        self.account = Account.objects.create(
+            first_name="Ada", last_name="Lovelace", email="ada@example.com"
+        )
+        self.data = {
+            "account": self.account.pk,
+            "transaction_amount": 25,
+            "transaction_amount_currency": "EUR",
+            "transaction_type": CREDIT,
+        }
+
+    def phases(self, response):
+        return [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+
+    def test_write_path_phases_in_header(self):
+        response = self.client.post(
+            reverse("create-transaction"), self.data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            self.phases(response),
+            ["auth", "validation", "wallet", "fx", "log", "commit", "total"],
+        )
+
+    def test_invalid_request_still_timed(self):
+        response = self.client.post(
+            reverse("create-transaction"), {"account": 1000}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.phases(response), ["auth", "validation", "total"])
+
+    @override_settings(SERVER_TIMING_LOG=True)
+    def test_timings_logged_when_enabled(self):
+        with self.assertLogs("transactions", "INFO") as logs:
+            self.client.post(reverse("create-transaction"), self.data, format="json")
+        event = logs.records[-1].event
+        self.assertEqual(event["event"], "request.timing")
+        self.assertEqual(event["status"], status.HTTP_201_CREATED)
+        self.assertIn("commit_ms", event)
@@ -0,0 +1,102 @@
+"""
+Per-request timing phases reported in the Server-Timing response header.
+
+A view activates a RequestTimings collector for the request; code on the
+request path wraps its work in `phase()`, which costs nothing when no
+collector is active.
+"""
+
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger("transactions")
+
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        entries = [
+            f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.phases.items()
+        ]
+        entries.append(f"total;dur={self.total() * 1000:.3f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def phase(name):
+    """
+    Add the time spent in the block to phase `name` of the current request.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+
+
+def record_phase(name, seconds):
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+class ServerTimingMixin:
+    """
+    APIView mixin timing JWT authentication and whatever the handler marks
+    with `phase()`, returned in a Server-Timing header and, with
+    SERVER_TIMING_LOG enabled, logged as a request.timing event.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        self._timings = RequestTimings()
+        self._timings_token = _current.set(self._timings)
+        super().initial(request, *args, **kwargs)
+
+    def perform_authentication(self, request):
+        with phase("auth"):
+            super().perform_authentication(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        timings = getattr(self, "_timings", None)
+        if timings is None:
+            return response
+        _current.reset(self._timings_token)
+        response["Server-Timing"] = timings.header()
+        if settings.SERVER_TIMING_LOG:
+            logger.info(
+                "Request timing",
+                extra={
+                    "event": {
+                        "event": "request.timing",
+                        "method": request.method,
+                        "path": request.path,
+                        "status": response.status_code,
+                        **{
+                            f"{name}_ms": round(seconds * 1000, 3)
+                            for name, seconds in timings.phases.items()
+                        },
+                        "total_ms": round(timings.total() * 1000, 3),
+                    }
+                },
+            )
+        return response
@@ -1,26 +1,85 @@
 from django.urls import path
+from accounts import async_views
 from accounts.views import (
     CreateAccountView,
     AccountDetailView,
     Transaction,
+    BulkTransactionView,
+    TransactionStreamView,
     AccountBalanceAPIView,
+    AccountBalanceAsOfView,
     AccountTransactionList,
     TransactionListAPIView,
+    TransactionExportView,
+    TransactionCSVExportView,
+    AccountStatementCSVView,
+    AccountStatementSummaryView,
     AccountListAPIView,
+    MetricsView,
 )
 
 urlpatterns = [
     path("account/create/", CreateAccountView.as_view(), name="create-account"),
     path("account/<int:pk>/", AccountDetailView.as_view(), name="show-account"),
     path("transaction/", Transaction.as_view(), name="create-transaction"),
+    path(
+        "transaction/bulk/", BulkTransactionView.as_view(), name="bulk-transaction"
+    ),
+    path(
+        "transaction/stream/",
+        TransactionStreamView.as_view(),
+        name="stream-transaction",
+    ),
     path(
         "wallet/<int:account_id>/", AccountBalanceAPIView.as_view(), name="show-balance"
     ),
+    path(
+        "wallet/<int:account_id>/as-of/",
+        AccountBalanceAsOfView.as_view(),
+        name="balance-as-of",
+    ),
     path(
         "transaction/<int:account_id>/",
         AccountTransactionList.as_view(),
         name="create-transaction",
     ),
+    path(
+        "transaction/<int:account_id>/export.csv",
+        AccountStatementCSVView.as_view(),
+        name="account-statement-csv",
+    ),
+    path(
+        "transaction/<int:account_id>/summary/",
+        AccountStatementSummaryView.as_view(),
+        name="account-statement-summary",
+    ),
     path("transactions/", TransactionListAPIView.as_view(), name="transaction-list"),
+    path(
+        "transactions/export/",
+        TransactionExportView.as_view(),
+        name="transaction-export",
+    ),
+    path(
+        "transactions/export.csv",
+        TransactionCSVExportView.as_view(),
+        name="transaction-export-csv",
+    ),
     path("accounts/", AccountListAPIView.as_view(), name="account-list"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
+    # Async-native read paths for ASGI deployments
+    path(
+        "async/account/<int:pk>/",
+        async_views.account_detail,
+        name="async-show-account",
+    ),
+    path(
+        "async/wallet/<int:account_id>/",
+        async_views.account_balance,
+        name="async-show-balance",
+    ),
+    path(
+        "async/transaction/<int:account_id>/",
+        async_views.account_transactions,
+        name="async-account-transactions",
+    ),
 ]
@@ -1,25 +1,338 @@
-import requests
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
 
+from accounts.metrics import metrics
+from accounts.providers import RateProviderError, get_rate_providers
 
-def get_exchange_rate(from_currency, to_currency):
-    api_key = settings.EXCHANGE_RATE_API_KEY
-    url = f"https://v6.exchangerate-api.com/v6/{api_key}/latest/{from_currency}"
+logger = logging.getLogger(__name__)
+
+
+class RateCache:
+    """
+    Thread-safe in-process cache of exchange rate tables keyed by base currency.
+
+    Entries are fresh for `ttl` seconds. Expired entries are kept so they can
+    still be served as stale values while a refresh is pending or failing, and
+    the least recently used entry is evicted once `maxsize` base currencies are held.
+    """
+
+    def __init__(self, ttl=3600, maxsize=32):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, base_currency):
+        with self._lock:
+            entry = self._entries.get(base_currency)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(base_currency)
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, base_currency, max_staleness):
+        """
+        Return an expired entry as long as it is at most `max_staleness`
+        seconds past its TTL.
+        """
+        with self._lock:
+            entry = self._entries.get(base_currency)
+            if entry is None or time.monotonic() - entry[0] > self.ttl + max_staleness:
+                return None
+            self.stale_hits += 1
+            return entry[1]
+
+    def set(self, base_currency, rates):
+        with self._lock:
+            self._entries[base_currency] = (time.monotonic(), rates)
+            self._entries.move_to_end(base_currency)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.stale_hits = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "size": len(self._entries),
+            }
+
+
+class RateTable(dict):
+    """
+    Conversion rates quoted against `base_currency`, together with the
+    provider that supplied them and the ExchangeRateSnapshot they were
+    persisted as.
+    """
+
+    def __init__(self, rates, base_currency, source="", snapshot_id=None):
+        super().__init__(rates)
+        self.base_currency = base_currency
+        self.source = source
+        self.snapshot_id = snapshot_id
+
+
+rate_cache = RateCache(
+    ttl=settings.EXCHANGE_RATE_CACHE_TTL,
+    maxsize=settings.EXCHANGE_RATE_CACHE_MAXSIZE,
+)
+
+
+def fetch_conversion_rates(base_currency):
+    """
+    Ask each configured provider in turn for the rate table quoted against
+    `base_currency` and return the first one that answers as a RateTable.
+    """
+    for provider in get_rate_providers():
+        started = time.perf_counter()
+        try:
+            rates = provider.fetch_rates(base_currency)
+        except RateProviderError as e:
+            record_fx_call(provider.name, "error", started)
+            logger.warning(
+                "Error fetching exchange rates from %s: %s", provider.name, e
+            )
+            continue
+        record_fx_call(provider.name, "success", started)
+        return RateTable(rates, base_currency, source=provider.name)
+    return None
+
+
+def record_fx_call(provider_name, outcome, started):
+    metrics.inc("fx_requests_total", {"provider": provider_name, "outcome": outcome})
+    metrics.observe(
+        "fx_request_duration_seconds",
+        time.perf_counter() - started,
+        {"provider": provider_name},
+    )
+
+
+def record_rate_snapshot(rates):
+    """
+    Persist a freshly fetched rate table as an ExchangeRateSnapshot and
+    attach the snapshot id to the table.
+
+    The insert runs in a savepoint, so a failed write leaves an enclosing
+    transaction usable and the table is simply used without a snapshot.
+    """
+    from accounts.models import ExchangeRateSnapshot
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        return data["conversion_rates"].get(to_currency, None)
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching exchange rates: {e}")
+        with transaction.atomic():
+            snapshot = ExchangeRateSnapshot.objects.create(
+                base_currency=rates.base_currency,
+                source=rates.source,
+                rates=dict(rates),
+            )
+    except DatabaseError as e:
+        logger.error("Error recording exchange rate snapshot: %s", e)
+        return None
+    rates.snapshot_id = snapshot.pk
+    return snapshot
+
+
+_pending = threading.local()
+
+
+def cache_rate_table(base_currency, rates):
+    """
+    Store `rates` in the shared cache once the snapshot it points at is
+    committed. Inside a transaction the table is only served to this thread
+    until then, and forgotten if the transaction rolls back, so no request
+    converts with a table whose snapshot row does not exist.
+    """
+    if not connection.in_atomic_block:
+        rate_cache.set(base_currency, rates)
+        return
+
+    def publish():
+        _pending_tables().pop(base_currency, None)
+        rate_cache.set(base_currency, rates)
+
+    transaction.on_commit(publish)
+    _pending_tables()[base_currency] = (rates, publish)
+
+
+def get_pending_rate_table(base_currency):
+    """
+    Return the table this thread fetched in its still open transaction, or
+    None when there is none or that transaction was rolled back.
+    """
+    tables = _pending_tables()
+    entry = tables.get(base_currency)
+    if entry is None:
         return None
+    rates, publish = entry
+    # Rolling back a transaction or savepoint discards its commit callbacks.
+    if any(callback[1] is publish for callback in connection.run_on_commit):
+        return rates
+    del tables[base_currency]
+    return None
+
+
+def _pending_tables():
+    if not hasattr(_pending, "tables"):
+        _pending.tables = {}
+    return _pending.tables
+
+
+def refresh_rate_table(base_currency=None):
+    """
+    Fetch a new rate table for `base_currency`, record it as a snapshot and
+    store it in the cache. Returns None when no provider could be reached.
+    """
+    base_currency = base_currency or settings.EXCHANGE_RATE_BASE_CURRENCY
+    rates = fetch_conversion_rates(base_currency)
+    if rates is not None:
+        record_rate_snapshot(rates)
+        cache_rate_table(base_currency, rates)
+    return rates
+
+
+def get_rate_table(base_currency=None):
+    """
+    Return the full conversion rate table for `base_currency`.
+
+    A fresh cached table is returned as is. An expired table within
+    EXCHANGE_RATE_MAX_STALENESS is served without waiting on the provider when
+    the background refresher is running, or as a fallback when a synchronous
+    refresh fails.
+    """
+    base_currency = base_currency or settings.EXCHANGE_RATE_BASE_CURRENCY
+    rates = get_pending_rate_table(base_currency) or rate_cache.get(base_currency)
+    if rates is not None:
+        return rates
+
+    max_staleness = settings.EXCHANGE_RATE_MAX_STALENESS
+    if rate_refresher.is_alive():
+        rates = rate_cache.get_stale(base_currency, max_staleness)
+        if rates is not None:
+            return rates
+
+    rates = refresh_rate_table(base_currency)
+    if rates is None:
+        rates = rate_cache.get_stale(base_currency, max_staleness)
+    return rates
+
+
+async def aget_rate_table(base_currency=None):
+    """
+    Async counterpart of get_rate_table(). Cached tables are returned without
+    leaving the event loop; only a refresh runs the blocking provider call
+    and snapshot write in a worker thread.
+    """
+    base_currency = base_currency or settings.EXCHANGE_RATE_BASE_CURRENCY
+    rates = rate_cache.get(base_currency)
+    if rates is not None:
+        return rates
+    return await sync_to_async(get_rate_table)(base_currency)
+
+
+class RateRefresher(threading.Thread):
+    """
+    Daemon thread that reloads the base currency rate table every `interval`
+    seconds, so requests are served from the cache instead of the provider.
+    After a failed refresh it retries every `retry_interval` seconds.
+    """
+
+    def __init__(self, interval, retry_interval=30):
+        super().__init__(name="exchange-rate-refresher", daemon=True)
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                rates = refresh_rate_table()
+            except Exception:
+                # Keep refreshing; a dead thread would silently stop serving
+                # stale tables while a refresh is pending.
+                logger.exception("Exchange rate refresh failed")
+                rates = None
+            finally:
+                close_old_connections()
+            wait = self.interval if rates is not None else self.retry_interval
+            self._stop_event.wait(wait)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+rate_refresher = RateRefresher(
+    interval=settings.EXCHANGE_RATE_REFRESH_INTERVAL,
+)
+
+
+def start_rate_refresher():
+    """
+    Start the background refresher once per process.
+    """
+    global rate_refresher
+    if rate_refresher.is_alive():
+        return rate_refresher
+    if rate_refresher.ident is not None:
+        # Threads cannot be restarted, so replace one that was stopped.
+        rate_refresher = RateRefresher(interval=rate_refresher.interval)
+    rate_refresher.start()
+    return rate_refresher
+
+
+def cross_rate(rates, from_currency, to_currency):
+    """
+    Derive the from -> to rate from a single base currency rate table.
+    """
+    from_rate = rates.get(from_currency)
+    to_rate = rates.get(to_currency)
+    if not from_rate or to_rate is None:
+        return None
+    return to_rate / from_rate
+
+
+def get_exchange_rate(from_currency, to_currency):
+    rates = get_rate_table()
+    if rates is None:
+        return None
+    return cross_rate(rates, from_currency, to_currency)
+
+
+async def aconvert_currency(amount, from_currency, to_currency):
+    if from_currency == to_currency:
+        return amount
+    # An empty table makes convert_currency() raise instead of retrying the
+    # blocking lookup on the event loop.
+    rates = await aget_rate_table() or {}
+    return convert_currency(amount, from_currency, to_currency, rates=rates)
 
 
-def convert_currency(amount, from_currency, to_currency):
+def convert_currency(amount, from_currency, to_currency, rates=None):
+    """
+    Convert `amount` using `rates`, or the current rate table when omitted.
+    """
     if from_currency == to_currency:
         return amount
-    rate = get_exchange_rate(from_currency, to_currency)
+    if rates is None:
+        rates = get_rate_table()
+    rate = cross_rate(rates, from_currency, to_currency) if rates else None
     if rate is None:
         raise ValueError(
             f"Could not retrieve exchange rate from {from_currency} to {to_currency}"
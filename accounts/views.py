@@ -2,10 +2,18 @@ from django.http import Http404
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from accounts.models import Account, Wallet, Transaction, TransactionLog
+from accounts.models import (
+    Account,
+    DailyBalanceSnapshot,
+    Wallet,
+    Transaction,
+    TransactionLog,
+)
+from accounts.models import Transaction as TransactionModel
 from accounts.serializers import (
     AccountSerializer,
     WalletSerializer,
+    BulkTransactionSerializer,
     TransactionSerializer,
     TransactionLogSerializer,
     AccountDetailSerializer,
@@ -20,7 +28,39 @@ from rest_framework_simplejwt.authentication import (
     JWTAuthentication,
 )  # Import JWTAuthentication
 
+import hashlib
+import json
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import IntegrityError
+from django.db.models import Count, F, Q, Sum, Window
+from django.db.models.functions import Coalesce, FirstValue, Trunc
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import etag
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from rest_framework.renderers import JSONRenderer
+from accounts.cache import (
+    cache_balance,
+    get_cache_generation,
+    get_cached_balance,
+)
+from accounts.constants import (
+    CREDIT,
+    DEBIT,
+    TRANSACTION_STATUS_FAILED,
+    TRANSACTION_STATUS_SUCCESS,
+)
+from accounts.exports import stream_csv, stream_json_array
+from accounts.metrics import metrics
+from accounts.pagination import KeysetPagination
+from accounts.renderers import NDJSONRenderer, ndjson_line
+from accounts.timing import ServerTimingMixin, phase
 
 
 class CreateAccountView(APIView):
@@ -122,11 +162,11 @@ class AccountDetailView(generics.RetrieveUpdateDestroyAPIView):
         )
 
 
-class Transaction(APIView):
+class Transaction(ServerTimingMixin, APIView):
     """
     API view to retrieve or create transactions.
 
-    Requires authentication.
+    Requires authentication. Responses carry a Server-Timing header.
 
     Methods:
     - get(request): Retrieve transactions.
@@ -150,12 +190,181 @@ class Transaction(APIView):
 
     def post(self, request):
         serializer = TransactionSerializer(data=request.data)
-        if serializer.is_valid():
+        with phase("validation"):
+            valid = serializer.is_valid()
+        if valid:
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BulkTransactionView(APIView):
+    """
+    API view to submit many transactions in one request.
+
+    Requires authentication.
+
+    Methods:
+    - post(request): Validate and apply a list of transactions, reporting a
+      result for each item in request order.
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {"error": "Expected a list of transactions."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(items) > settings.TRANSACTION_BULK_MAX_ITEMS:
+            return Response(
+                {
+                    "error": f"At most {settings.TRANSACTION_BULK_MAX_ITEMS} "
+                    "transactions can be submitted at once."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response({"results": apply_transaction_items(items)})
+
+
+def apply_transaction_items(items):
+    """
+    Validate `items` and apply the valid ones as one batch. Returns one result
+    per item with its index, a status of success, failed or invalid, and
+    either the created transaction or the validation errors.
+    """
+    results = [None] * len(items)
+    pending = []
+    positions = []
+    for index, item in enumerate(items):
+        serializer = BulkTransactionSerializer(data=item)
+        if serializer.is_valid():
+            pending.append(TransactionModel(**serializer.validated_data))
+            positions.append(index)
+        else:
+            results[index] = {
+                "index": index,
+                "status": "invalid",
+                "errors": serializer.errors,
+            }
+
+    for index, outcome in zip(positions, TransactionModel.bulk_apply(pending)):
+        if isinstance(outcome, ValidationError):
+            results[index] = {
+                "index": index,
+                "status": "invalid",
+                "errors": outcome.messages,
+            }
+        else:
+            results[index] = {
+                "index": index,
+                "status": outcome.transaction_status,
+                "transaction": TransactionSerializer(outcome).data,
+            }
+    return results
+
+
+class TransactionStreamView(APIView):
+    """
+    API view to ingest newline-delimited JSON transactions.
+
+    Requires authentication.
+
+    The request body is read line by line as it arrives and applied in
+    chunks of TRANSACTION_STREAM_CHUNK_SIZE, each committed on its own.
+    One NDJSON result line is streamed back per non-empty input line, so
+    memory use does not grow with the size of the upload.
+
+    The body is only readable when the request carries a Content-Length, so
+    chunked uploads without one are rejected with 411 rather than being
+    treated as empty.
+
+    Methods:
+    - post(request): Stream transactions in and results out.
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, JSONRenderer]
+
+    def post(self, request):
+        if request.stream is None:
+            if not request.META.get("CONTENT_LENGTH"):
+                return Response(
+                    {"error": "A Content-Length header is required."},
+                    status=status.HTTP_411_LENGTH_REQUIRED,
+                )
+            return Response(
+                {"error": "The request body is empty."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return StreamingHttpResponse(
+            stream_transaction_results(
+                request.stream, settings.TRANSACTION_STREAM_CHUNK_SIZE
+            ),
+            content_type=NDJSONRenderer.media_type,
+        )
+
+
+def stream_transaction_results(lines, chunk_size):
+    """
+    Apply the NDJSON transactions in `lines` chunk by chunk and yield one
+    encoded result line per input line, tagged with its 1-based line number.
+    """
+    chunk = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            item = e
+        chunk.append((line_number, item))
+        if len(chunk) >= chunk_size:
+            yield from _apply_stream_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield from _apply_stream_chunk(chunk)
+
+
+def _apply_stream_chunk(chunk):
+    items = [item for _, item in chunk if not isinstance(item, ValueError)]
+    results = iter(apply_transaction_items(items))
+    for line_number, item in chunk:
+        if isinstance(item, ValueError):
+            result = {"status": "invalid", "errors": [f"Invalid JSON: {item}"]}
+        else:
+            result = next(results)
+            del result["index"]
+        yield ndjson_line({"line": line_number, **result})
+
+
+def history_etag(request, account_id):
+    """
+    Version tag of an account history page: the ledger version kept on the
+    account's wallet, combined with the page's query string.
+    """
+    version = (
+        Wallet.objects.filter(account_id=account_id)
+        .values_list("ledger_version", flat=True)
+        .first()
+    )
+    if version is None:
+        if not Account.objects.filter(id=account_id).exists():
+            return None
+        version = 0
+    return history_tag(request, account_id, version)
+
+
+def history_tag(request, account_id, version):
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return f"{account_id}-v{version}-{query}"
+
+
+@method_decorator(etag(history_etag), name="get")
 class AccountTransactionList(ListAPIView):
     """
     API view to list transactions associated with a specific account.
@@ -164,11 +373,13 @@ class AccountTransactionList(ListAPIView):
 
     Methods:
     - list(request, *args, **kwargs): List transactions for the account.
+      Answers 304 when If-None-Match carries the current ETag.
     """
 
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
     serializer_class = TransactionLogSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         account_id = self.kwargs.get(
@@ -184,8 +395,9 @@ class AccountTransactionList(ListAPIView):
     def list(self, request, *args, **kwargs):
         try:
             queryset = self.get_queryset()
-            serializer = self.serializer_class(queryset, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            page = self.paginate_queryset(queryset)
+            serializer = self.serializer_class(page, many=True)
+            return self.get_paginated_response(serializer.data)
         except Http404:
             return Response(
                 {"message": "Transactions for this account not found."},
@@ -209,6 +421,7 @@ class TransactionListAPIView(ListAPIView):
     permission_classes = [IsAuthenticated]  # Add IsAuthenticated permission
 
     serializer_class = TransactionLogSerializer
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         try:
@@ -219,6 +432,283 @@ class TransactionListAPIView(ListAPIView):
             )
 
 
+class TransactionExportView(APIView):
+    """
+    API view to export the full transaction ledger as one JSON array.
+
+    Requires authentication.
+
+    The array is written incrementally from a chunked queryset iterator, so
+    memory use stays constant however large the ledger is.
+
+    Methods:
+    - get(request): Stream all transactions ordered by time.
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        queryset = TransactionLog.objects.order_by("transaction_time", "id")
+        return StreamingHttpResponse(
+            stream_json_array(
+                queryset,
+                TransactionLogSerializer,
+                settings.TRANSACTION_EXPORT_CHUNK_SIZE,
+            ),
+            content_type="application/json",
+        )
+
+
+LEDGER_CSV_FIELDS = [
+    "id",
+    "account_id",
+    "transaction_time",
+    "transaction_type",
+    "transaction_status",
+    "transaction_amount",
+    "transaction_currency",
+    "converted_amount",
+    "wallet_currency",
+    "current_balance",
+    "rate_snapshot_id",
+]
+
+
+def parse_time_range(request):
+    """
+    Read the optional `start` and `end` query parameters as ISO dates or
+    datetimes. `start` is inclusive and `end` exclusive, except that a plain
+    date as `end` includes that whole day.
+    """
+    bounds = []
+    for name in ("start", "end"):
+        value = request.query_params.get(name)
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            day = parse_date(value)
+            moment = None if day else parse_datetime(value)
+        except ValueError:
+            day = moment = None
+        if day is not None:
+            if name == "end":
+                day += timedelta(days=1)
+            moment = datetime.combine(day, time.min)
+        if moment is None:
+            raise DRFValidationError({name: "Expected an ISO date or datetime."})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        bounds.append(moment)
+    return tuple(bounds)
+
+
+def filter_time_range(queryset, request):
+    start, end = parse_time_range(request)
+    if start is not None:
+        queryset = queryset.filter(transaction_time__gte=start)
+    if end is not None:
+        queryset = queryset.filter(transaction_time__lt=end)
+    return queryset
+
+
+def csv_export_response(queryset, filename):
+    response = StreamingHttpResponse(
+        stream_csv(
+            queryset.order_by("transaction_time", "id"),
+            LEDGER_CSV_FIELDS,
+            settings.TRANSACTION_EXPORT_CHUNK_SIZE,
+        ),
+        content_type="text/csv",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+class TransactionCSVExportView(APIView):
+    """
+    API view to export the full transaction ledger as CSV.
+
+    Requires authentication.
+
+    Methods:
+    - get(request): Stream transactions between the optional `start` and
+      `end` query parameters.
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        queryset = filter_time_range(TransactionLog.objects.all(), request)
+        return csv_export_response(queryset, "transactions.csv")
+
+
+class AccountStatementCSVView(APIView):
+    """
+    API view to export the statement of a specific account as CSV.
+
+    Requires authentication.
+
+    Methods:
+    - get(request, account_id): Stream the account's transactions between
+      the optional `start` and `end` query parameters.
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, account_id):
+        if not Account.objects.filter(id=account_id).exists():
+            return Response(
+                {"error": f"Account with id {account_id} does not exist"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        queryset = filter_time_range(
+            TransactionLog.objects.filter(account_id=account_id), request
+        )
+        return csv_export_response(queryset, f"account-{account_id}-statement.csv")
+
+
+STATEMENT_PERIODS = ("day", "week", "month")
+
+
+def summarize_periods(queryset, period):
+    """
+    Aggregate ledger rows per `period` in the database. Amounts are summed in
+    the wallet currency, and the closing balance is the balance after the
+    last row of each period by (transaction time, id).
+    """
+    amount = Coalesce("converted_amount", "transaction_amount")
+    succeeded = Q(transaction_status=TRANSACTION_STATUS_SUCCESS)
+    rows = list(
+        queryset.annotate(period=Trunc("transaction_time", period))
+        .values("period")
+        .annotate(
+            credits=Coalesce(
+                Sum(amount, filter=succeeded & Q(transaction_type=CREDIT)), 0.0
+            ),
+            debits=Coalesce(
+                Sum(amount, filter=succeeded & Q(transaction_type=DEBIT)), 0.0
+            ),
+            failed=Count("id", filter=Q(transaction_status=TRANSACTION_STATUS_FAILED)),
+            count=Count("id"),
+        )
+        .order_by("period")
+    )
+    # Imported rows may be applied out of time order, so ids do not follow
+    # transaction times; pick each period's last row with a window function.
+    closing = dict(
+        queryset.annotate(
+            period=Trunc("transaction_time", period),
+            last_id=Window(
+                FirstValue("id"),
+                partition_by=[Trunc("transaction_time", period)],
+                order_by=[F("transaction_time").desc(), F("id").desc()],
+            ),
+        )
+        .filter(id=F("last_id"))
+        .values_list("period", "current_balance")
+    )
+    for row in rows:
+        row["closing_balance"] = closing[row["period"]]
+        row["period"] = row["period"].date()
+    return rows
+
+
+class AccountStatementSummaryView(APIView):
+    """
+    API view to summarize the statement of a specific account per period.
+
+    Requires authentication.
+
+    Methods:
+    - get(request, account_id): Return credit and debit totals, failed and
+      total counts and the closing balance per `period` (day, week or month)
+      between the optional `start` and `end` query parameters.
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, account_id):
+        period = request.query_params.get("period", "month")
+        if period not in STATEMENT_PERIODS:
+            return Response(
+                {"error": f"period must be one of {', '.join(STATEMENT_PERIODS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not Account.objects.filter(id=account_id).exists():
+            return Response(
+                {"error": f"Account with id {account_id} does not exist"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        queryset = filter_time_range(
+            TransactionLog.objects.filter(account_id=account_id), request
+        )
+        return Response(
+            {
+                "account": account_id,
+                "period": period,
+                "results": summarize_periods(queryset, period),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+def get_balance_payload(account_id):
+    """
+    Return the balance payload of `account_id`, from the cache when present.
+    A miss loads the wallet and its owner with one query.
+    """
+    generation = get_cache_generation(account_id)
+    payload = get_cached_balance(account_id, generation)
+    if payload is not None:
+        return payload
+    try:
+        wallet = Wallet.objects.select_related("account").get(account_id=account_id)
+    except Wallet.DoesNotExist:
+        if not Account.objects.filter(id=account_id).exists():
+            raise Account.DoesNotExist
+        raise
+    payload = build_balance_payload(wallet)
+    cache_balance(account_id, generation, payload)
+    return payload
+
+
+def build_balance_payload(wallet):
+    account = wallet.account
+    owner_details = {
+        "first_name": account.first_name,
+        "last_name": account.last_name,
+        "email": account.email,
+        "date_of_birth": account.date_of_birth,
+    }
+    return {
+        "account_owner": owner_details,
+        "wallet currency": wallet.currency,
+        "balance": wallet.balance,
+    }
+
+
+def balance_etag(request, account_id):
+    """
+    Version tag of the balance payload, a digest of the payload itself.
+    """
+    try:
+        payload = get_balance_payload(account_id)
+    except (Account.DoesNotExist, Wallet.DoesNotExist):
+        return None
+    return payload_digest(payload)
+
+
+def payload_digest(payload):
+    content = json.dumps(payload, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+@method_decorator(etag(balance_etag), name="get")
 class AccountBalanceAPIView(APIView):
     """
     API view to retrieve the balance of a specific account.
@@ -226,7 +716,8 @@ class AccountBalanceAPIView(APIView):
     Requires authentication.
 
     Methods:
-    - get(request, account_id): Retrieve the balance of the account.
+    - get(request, account_id): Retrieve the balance of the account. Answers
+      304 when If-None-Match carries the current ETag.
     """
 
     authentication_classes = [JWTAuthentication]
@@ -234,18 +725,8 @@ class AccountBalanceAPIView(APIView):
 
     def get(self, request, account_id):
         try:
-            account = Account.objects.get(id=account_id)
-            wallet = Wallet.objects.get(account=account)
-            owner_details = {
-                "first_name": account.first_name,
-                "last_name": account.last_name,
-                "email": account.email,
-                "date_of_birth": account.date_of_birth,
-            }
-            return Response(
-                {"account_owner": owner_details, "wallet currency": wallet.currency,"balance": wallet.balance},
-                status=status.HTTP_200_OK,
-            )
+            payload = get_balance_payload(account_id)
+            return Response(payload, status=status.HTTP_200_OK)
         except Account.DoesNotExist:
             return Response(
                 {"error": f"Account with id {account_id} does not exist"},
@@ -262,6 +743,53 @@ class AccountBalanceAPIView(APIView):
             )
 
 
+class AccountBalanceAsOfView(APIView):
+    """
+    API view to retrieve the balance of a specific account at a past moment.
+
+    Requires authentication.
+
+    Methods:
+    - get(request, account_id): Return the balance after the last ledger row
+      at or before the `at` query parameter (an ISO datetime), with that
+      row's id. An account without earlier rows reports a zero balance.
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, account_id):
+        try:
+            when = parse_datetime(request.query_params.get("at", ""))
+        except ValueError:
+            when = None
+        if when is None:
+            return Response(
+                {"error": "Query parameter 'at' must be an ISO datetime."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+
+        log = DailyBalanceSnapshot.balance_as_of(account_id, when)
+        if log is None and not Account.objects.filter(id=account_id).exists():
+            return Response(
+                {"error": f"Account with id {account_id} does not exist"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "account": account_id,
+                "at": when,
+                "balance": log.current_balance if log else 0.0,
+                "wallet_currency": log.wallet_currency if log else None,
+                "transaction_log": log.pk if log else None,
+                "transaction_time": log.transaction_time if log else None,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class AccountListAPIView(APIView):
     """
     API view to retrieve a list of all accounts.
@@ -289,3 +817,22 @@ class AccountListAPIView(APIView):
 
     def get_queryset(self):
         return Account.objects.all()
+
+
+class MetricsView(APIView):
+    """
+    API view to expose the process metrics in the Prometheus text format.
+
+    Requires authentication.
+
+    Methods:
+    - get(request): Render all counters and histograms.
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
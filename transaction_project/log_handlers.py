@@ -0,0 +1,104 @@
+"""
+Logging handlers and formatters referenced from settings.LOGGING.
+"""
+
+import copy
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueListener, RotatingFileHandler
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line. Structured fields passed as
+    `extra={"event": {...}}` are merged into the object.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "event", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, cls=DjangoJSONEncoder)
+
+
+class _DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room so stopping a listener behind a full queue still
+        # drains it instead of failing.
+        self.queue.put(self._sentinel)
+
+
+class QueuedRotatingFileHandler(logging.Handler):
+    """
+    Size-rotated log file written by a background thread.
+
+    Records are formatted in the logging thread and put on a bounded queue
+    without waiting; a QueueListener thread does the file I/O. When the
+    queue is full the record is dropped and counted in `dropped` rather than
+    blocking the caller.
+
+    This is a plain Handler that owns its queue rather than a QueueHandler
+    subclass: dictConfig() on Python 3.12+ configures QueueHandler
+    subclasses through its own queue/listener keys and rejects the file
+    arguments this handler takes.
+    """
+
+    def __init__(
+        self, filename, maxBytes=0, backupCount=0, encoding=None, queue_size=10000
+    ):
+        super().__init__()
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.target = RotatingFileHandler(
+            filename,
+            maxBytes=maxBytes,
+            backupCount=backupCount,
+            encoding=encoding,
+            delay=True,
+        )
+        self.listener = _DrainingQueueListener(self.queue, self.target)
+        self.listener.start()
+        self.listening = True
+
+    def emit(self, record):
+        try:
+            record = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # The listener thread only writes the message, so format here and
+        # drop what cannot or need not cross the thread boundary.
+        message = self.format(record)
+        record = copy.copy(record)
+        record.message = message
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+    def close(self):
+        # Drain the queue before the file is closed; logging.shutdown() calls
+        # this at exit.
+        if self.listening:
+            self.listening = False
+            self.listener.stop()
+            self.target.close()
+        super().close()
@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the latency it records covers the other middleware too
+    "accounts.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -73,6 +75,32 @@ SIMPLE_JWT = {
 }
 SESSION_COOKIE_AGE = 3600  # Set session timeout to 1 hour (in seconds)
 
+# Maximum number of transactions accepted by one POST /transaction/bulk/
+TRANSACTION_BULK_MAX_ITEMS = config(
+    "TRANSACTION_BULK_MAX_ITEMS", default=5000, cast=int
+)
+# Rows per page of the transaction history endpoints, and the largest page
+# clients may ask for with ?page_size=
+TRANSACTION_PAGE_SIZE = config("TRANSACTION_PAGE_SIZE", default=100, cast=int)
+TRANSACTION_MAX_PAGE_SIZE = config("TRANSACTION_MAX_PAGE_SIZE", default=1000, cast=int)
+# Rows fetched per database round trip by the streaming ledger exports
+TRANSACTION_EXPORT_CHUNK_SIZE = config(
+    "TRANSACTION_EXPORT_CHUNK_SIZE", default=2000, cast=int
+)
+# Transactions applied and committed together by POST /transaction/stream/
+TRANSACTION_STREAM_CHUNK_SIZE = config(
+    "TRANSACTION_STREAM_CHUNK_SIZE", default=500, cast=int
+)
+# Write-behind TransactionLog batches (accounts.ledger.TransactionLogWriter):
+# rows per bulk insert, and seconds a queued row may wait for its batch
+TRANSACTION_LOG_BATCH_SIZE = config("TRANSACTION_LOG_BATCH_SIZE", default=500, cast=int)
+TRANSACTION_LOG_FLUSH_INTERVAL = config(
+    "TRANSACTION_LOG_FLUSH_INTERVAL", default=1.0, cast=float
+)
+# Also log the Server-Timing phases of POST /transaction/ as request.timing
+# events on the transactions logger
+SERVER_TIMING_LOG = config("SERVER_TIMING_LOG", default=False, cast=bool)
+
 ROOT_URLCONF = "transaction_project.urls"
 
 TEMPLATES = [
@@ -105,6 +133,25 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# The local-memory backend is private to each process. When running several
+# worker processes, point CACHE_BACKEND/CACHE_LOCATION at a shared cache such
+# as Redis or Memcached so balance invalidations reach every worker.
+
+CACHES = {
+    "default": {
+        "BACKEND": config(
+            "CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": config("CACHE_LOCATION", default="transaction-project"),
+    }
+}
+
+# Seconds a cached balance payload may live; writes invalidate it earlier.
+BALANCE_CACHE_TTL = config("BALANCE_CACHE_TTL", default=300, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -147,29 +194,106 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# Log records are formatted as JSON lines and handed to a background thread
+# that writes them to a size-rotated file, so requests never wait on log I/O.
+# Each process rotates its own file; with several worker processes give each
+# its own LOG_FILE. Set DJANGO_LOG_LEVEL=DEBUG (with DEBUG on) to log SQL.
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "json": {
+            "()": "transaction_project.log_handlers.JSONFormatter",
+        },
+    },
     "handlers": {
         "file": {
             "level": "DEBUG",
-            "class": "logging.FileHandler",
-            "filename": os.path.join(BASE_DIR, "transactions.log"),
+            "class": "transaction_project.log_handlers.QueuedRotatingFileHandler",
+            "filename": config(
+                "LOG_FILE", default=os.path.join(BASE_DIR, "transactions.log")
+            ),
+            "maxBytes": config("LOG_MAX_BYTES", default=10 * 1024 * 1024, cast=int),
+            "backupCount": config("LOG_BACKUP_COUNT", default=5, cast=int),
+            "formatter": "json",
         },
     },
     "loggers": {
         "django": {
             "handlers": ["file"],
-            "level": "DEBUG",
+            "level": config("DJANGO_LOG_LEVEL", default="INFO"),
             "propagate": True,
         },
         "transactions": {
             "handlers": ["file"],
-            "level": "DEBUG",
+            "level": config("TRANSACTIONS_LOG_LEVEL", default="INFO"),
+            "propagate": False,
+        },
+        "accounts": {
+            "handlers": ["file"],
+            "level": config("ACCOUNTS_LOG_LEVEL", default="INFO"),
             "propagate": False,
         },
     },
 }
 
 
-EXCHANGE_RATE_API_KEY = config("EXCHANGE_RATE_API_KEY")
+# Rate table sources, tried in order until one answers. Available backends:
+# accounts.providers.HTTPRateProvider (exchangerate-api),
+# accounts.providers.FileRateProvider (JSON/CSV file at EXCHANGE_RATE_FILE) and
+# accounts.providers.DatabaseRateProvider (the ExchangeRate table).
+EXCHANGE_RATE_PROVIDERS = config(
+    "EXCHANGE_RATE_PROVIDERS",
+    default="accounts.providers.HTTPRateProvider",
+    cast=Csv(),
+)
+EXCHANGE_RATE_FILE = config(
+    "EXCHANGE_RATE_FILE", default=os.path.join(BASE_DIR, "exchange_rates.json")
+)
+
+EXCHANGE_RATE_API_KEY = config("EXCHANGE_RATE_API_KEY", default="")
+EXCHANGE_RATE_API_URL = config(
+    "EXCHANGE_RATE_API_URL", default="https://v6.exchangerate-api.com/v6"
+)
+
+# HTTP client for the rate provider: connect/read timeouts in seconds, retries
+# with jittered exponential backoff, keep-alive pool size and circuit breaker.
+EXCHANGE_RATE_CONNECT_TIMEOUT = config(
+    "EXCHANGE_RATE_CONNECT_TIMEOUT", default=3.05, cast=float
+)
+EXCHANGE_RATE_READ_TIMEOUT = config("EXCHANGE_RATE_READ_TIMEOUT", default=5, cast=float)
+EXCHANGE_RATE_RETRIES = config("EXCHANGE_RATE_RETRIES", default=2, cast=int)
+EXCHANGE_RATE_RETRY_BACKOFF = config(
+    "EXCHANGE_RATE_RETRY_BACKOFF", default=0.25, cast=float
+)
+EXCHANGE_RATE_POOL_SIZE = config("EXCHANGE_RATE_POOL_SIZE", default=10, cast=int)
+EXCHANGE_RATE_CIRCUIT_FAILURE_THRESHOLD = config(
+    "EXCHANGE_RATE_CIRCUIT_FAILURE_THRESHOLD", default=5, cast=int
+)
+EXCHANGE_RATE_CIRCUIT_RESET_TIMEOUT = config(
+    "EXCHANGE_RATE_CIRCUIT_RESET_TIMEOUT", default=30, cast=float
+)
+
+# Every currency pair is derived from one rate table quoted against this currency.
+EXCHANGE_RATE_BASE_CURRENCY = config("EXCHANGE_RATE_BASE_CURRENCY", default="EUR")
+
+# In-process exchange rate cache: seconds a rate table stays fresh and the
+# maximum number of base currencies kept before the least recently used is evicted.
+EXCHANGE_RATE_CACHE_TTL = config("EXCHANGE_RATE_CACHE_TTL", default=3600, cast=int)
+EXCHANGE_RATE_CACHE_MAXSIZE = config(
+    "EXCHANGE_RATE_CACHE_MAXSIZE", default=32, cast=int
+)
+
+# Background refresh of the rate table. The refresher reloads the table every
+# EXCHANGE_RATE_REFRESH_INTERVAL seconds (keep it below the cache TTL); expired
+# tables are still served for up to EXCHANGE_RATE_MAX_STALENESS seconds while
+# the provider is unavailable.
+EXCHANGE_RATE_BACKGROUND_REFRESH = config(
+    "EXCHANGE_RATE_BACKGROUND_REFRESH", default=False, cast=bool
+)
+EXCHANGE_RATE_REFRESH_INTERVAL = config(
+    "EXCHANGE_RATE_REFRESH_INTERVAL", default=3000, cast=int
+)
+EXCHANGE_RATE_MAX_STALENESS = config(
+    "EXCHANGE_RATE_MAX_STALENESS", default=1800, cast=int
+)